@@ -1,2 +1,3 @@
-__all__ = []
+from .detectors import DetectionResult, detect, detect_paths, is_detection_input
 
+__all__ = ['DetectionResult', 'detect', 'detect_paths', 'is_detection_input']
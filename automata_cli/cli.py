@@ -12,6 +12,13 @@ def main() -> None:
     p_run.add_argument('--cwd', type=str, default='.', help='Project directory')
     p_run.add_argument('--config', type=str, default='automata.yml', help='Config path')
     p_run.add_argument('--stage', type=str, choices=['all', 'detect', 'build', 'test', 'deploy'], default='all')
+    p_run.add_argument('--no-cache', action='store_true', help='Ignore cached detection results')
+    p_run.add_argument('--jobs', type=int, default=None, help='Max languages built in parallel')
+    p_run.add_argument('--shards', type=int, default=None, help='Split each test suite across N processes')
+    p_run.add_argument('--changed-since', type=str, default=None, metavar='REF',
+                       help='Run only tests affected by changes since git REF')
+    p_run.add_argument('--trace', type=str, default=None, metavar='PATH',
+                       help='Chrome trace output (default: .automata/trace.json)')
 
     p_generate = sub.add_parser('generate', help='Generate automata.yml config')
     p_generate.add_argument('--cwd', type=str, default='.', help='Project directory')
@@ -22,12 +29,18 @@ def main() -> None:
     if args.cmd == 'run':
         cwd = Path(args.cwd).resolve()
         config_path = (cwd / args.config).resolve()
-        run_pipeline(cwd=cwd, config_path=config_path, stage=args.stage)
+        ok = run_pipeline(cwd=cwd, config_path=config_path, stage=args.stage, use_cache=not args.no_cache,
+                          jobs=args.jobs, shards=args.shards,
+                          changed_since=args.changed_since,
+                          trace_path=Path(args.trace).resolve() if args.trace else None)
+        if not ok:
+            raise SystemExit(1)
     
     elif args.cmd == 'generate':
         cwd = Path(args.cwd).resolve()
         from .detectors import detect_project
-        detected = detect_project(cwd)
+        from .utils.config import load_config
+        detected = detect_project(cwd, load_config(cwd / 'automata.yml'))
         auto_generate_config(cwd, detected, force=args.force)
 
 
@@ -1,27 +1,408 @@
+import fnmatch
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+from .utils.cache import cache_dir, git_output, read_json, write_json
+from .utils.config import load_config
 
-def detect_project(cwd: Path) -> dict:
-    files = [p for p in cwd.rglob('*') if p.is_file() and '.git' not in p.parts and 'node_modules' not in p.parts]
-    names = [p.name.lower() for p in files]
-
-    languages = []
-    if 'package.json' in names:
-        languages.append('node')
-    if 'requirements.txt' in names or 'pyproject.toml' in names:
-        languages.append('python')
-    if 'pom.xml' in names or 'build.gradle' in names or 'build.gradle.kts' in names:
-        languages.append('java')
-    if 'go.mod' in names:
-        languages.append('go')
-    if 'cargo.toml' in names:
-        languages.append('rust')
-    if 'dockerfile' in names:
-        languages.append('docker')
+
+# Метаданные VCS и собственный кэш automata: не часть проекта ни для какого обхода
+VCS_DIRS = ('.git', '.hg', '.svn', '.automata')
+
+# Каталоги, в которые детектор никогда не спускается
+DEFAULT_IGNORE = VCS_DIRS + (
+    'node_modules', 'bower_components',
+    '.venv', 'venv', '__pycache__', '.tox', '.nox',
+    '.mypy_cache', '.pytest_cache', '.ruff_cache',
+    'target', 'build', 'dist', 'out', '.gradle', '.idea',
+)
+
+# Таблица правил детектора: язык -> маркер-файлы (имена в нижнем регистре) и расширения
+# исходников. Язык проекта определяют только маркеры — по ним CLI выбирает сборщики;
+# расширения дают source_languages и учёт байтов по языкам.
+LANGUAGE_RULES = {
+    'node': {
+        'markers': ('package.json',),
+        'suffixes': ('.js', '.mjs', '.cjs', '.jsx', '.ts', '.tsx'),
+    },
+    'python': {
+        'markers': ('requirements.txt', 'pyproject.toml'),
+        'suffixes': ('.py',),
+    },
+    'java': {
+        'markers': ('pom.xml', 'build.gradle', 'build.gradle.kts'),
+        'suffixes': ('.java', '.kt'),
+    },
+    'go': {
+        'markers': ('go.mod',),
+        'suffixes': ('.go',),
+    },
+    'rust': {
+        'markers': ('cargo.toml',),
+        'suffixes': ('.rs',),
+    },
+    'docker': {
+        'markers': ('dockerfile',),
+        'suffixes': (),
+    },
+}
+
+LANGUAGE_ORDER = tuple(LANGUAGE_RULES)
+
+# Индексы, построенные по таблице один раз: имя файла -> язык, расширение -> язык
+MARKERS = {name: lang for lang, rule in LANGUAGE_RULES.items() for name in rule['markers']}
+SUFFIXES = {suffix: lang for lang, rule in LANGUAGE_RULES.items() for suffix in rule['suffixes']}
+
+
+class IgnoreRules:
+    """Упрощённые правила в стиле .gitignore, привязанные к каталогу."""
+
+    def __init__(self, base: str, patterns: List[str]):
+        self.base = base
+        self.rules: List[Tuple[str, bool, bool, bool]] = []
+        for raw in patterns:
+            line = raw.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/') if dir_only else line
+            # как в git: косая черта в начале или середине шаблона привязывает его к каталогу .gitignore
+            anchored = '/' in line
+            line = line.lstrip('/')
+            if line:
+                self.rules.append((line, negate, dir_only, anchored))
+
+    def match(self, rel: str, name: str, is_dir: bool) -> Optional[bool]:
+        if self.base:
+            if not rel.startswith(self.base + '/'):
+                return None
+            rel = rel[len(self.base) + 1:]
+        result = None
+        for pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            target = rel if anchored else name
+            if fnmatch.fnmatchcase(target, pattern):
+                result = not negate
+        return result
+
+
+def _read_gitignore(path: str, base: str) -> Optional[IgnoreRules]:
+    try:
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            rules = IgnoreRules(base, f.readlines())
+    except OSError:
+        return None
+    return rules if rules.rules else None
+
+
+def _is_ignored(rules: List[IgnoreRules], rel: str, name: str, is_dir: bool) -> bool:
+    ignored = False
+    for r in rules:
+        verdict = r.match(rel, name, is_dir)
+        if verdict is not None:
+            ignored = verdict
+    return ignored
+
+
+def iter_project_files(cwd: Path, cfg: Optional[Dict] = None,
+                       visited_dirs: Optional[List[str]] = None) -> Iterator[Tuple[str, os.DirEntry]]:
+    """Обходит проект через os.scandir, отсекая игнорируемые каталоги до входа в них.
+
+    Возвращает пары (относительный путь через '/', DirEntry) для каждого файла.
+    Если передан visited_dirs, в него складываются относительные пути обойдённых каталогов.
+    """
+    detect_cfg = (cfg or {}).get('detect') or {}
+    skip_names = set(DEFAULT_IGNORE) | set(detect_cfg.get('skip_dirs') or [])
+    root_rules = []
+    if detect_cfg.get('ignore'):
+        root_rules.append(IgnoreRules('', list(detect_cfg['ignore'])))
+    use_gitignore = detect_cfg.get('gitignore', True)
+
+    stack: List[Tuple[str, str, List[IgnoreRules]]] = [(str(cwd), '', root_rules)]
+    while stack:
+        path, rel_dir, rules = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        if visited_dirs is not None:
+            visited_dirs.append(rel_dir)
+        with it:
+            entries = list(it)
+        if use_gitignore and any(e.name == '.gitignore' for e in entries):
+            local = _read_gitignore(os.path.join(path, '.gitignore'), rel_dir)
+            if local:
+                rules = rules + [local]
+        for entry in entries:
+            name = entry.name
+            rel = f'{rel_dir}/{name}' if rel_dir else name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if name in skip_names or _is_ignored(rules, rel, name, True):
+                    continue
+                stack.append((entry.path, rel, rules))
+            else:
+                try:
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if rules and _is_ignored(rules, rel, name, False):
+                    continue
+                yield rel, entry
+
+
+def iter_listed_files(paths: Iterable[str], cfg: Optional[Dict] = None,
+                      root: Optional[Path] = None) -> Iterator[Tuple[str, str, Optional[int]]]:
+    """То же, что iter_project_files, но по готовому списку путей (например, `git ls-tree`).
+
+    Пути — относительные, через '/'. Содержимое .gitignore читается из root, если файл
+    там есть (при разреженном checkout достаточно выложить только их). Возвращает пары
+    (относительный путь, имя файла, размер или None).
+    """
+    detect_cfg = (cfg or {}).get('detect') or {}
+    skip_names = set(DEFAULT_IGNORE) | set(detect_cfg.get('skip_dirs') or [])
+    root_rules = []
+    if detect_cfg.get('ignore'):
+        root_rules.append(IgnoreRules('', list(detect_cfg['ignore'])))
+    use_gitignore = detect_cfg.get('gitignore', True) and root is not None
+
+    paths = list(paths)
+    listed = set(paths)
+    # каталог -> правила для его содержимого, либо None, если каталог отсечён
+    dirs: Dict[str, Optional[List[IgnoreRules]]] = {}
+
+    def dir_rules(rel_dir: str) -> Optional[List[IgnoreRules]]:
+        if rel_dir in dirs:
+            return dirs[rel_dir]
+        if rel_dir:
+            parent, _, name = rel_dir.rpartition('/')
+            rules = dir_rules(parent)
+            if rules is not None and (name in skip_names or _is_ignored(rules, rel_dir, name, True)):
+                rules = None
+        else:
+            rules = root_rules
+        gitignore = f'{rel_dir}/.gitignore' if rel_dir else '.gitignore'
+        if rules is not None and use_gitignore and gitignore in listed:
+            local = _read_gitignore(str(root / gitignore), rel_dir)
+            if local:
+                rules = rules + [local]
+        dirs[rel_dir] = rules
+        return rules
+
+    for rel in paths:
+        rel_dir, _, name = rel.rpartition('/')
+        rules = dir_rules(rel_dir)
+        if rules is None or (rules and _is_ignored(rules, rel, name, False)):
+            continue
+        yield rel, name, None
+
+
+def _tally(files: Iterable[Tuple[str, str, Union[int, None, os.DirEntry]]],
+           watched: Optional[List[str]] = None) -> dict:
+    """Один проход по файлам: маркеры, гистограмма расширений и байты исходников по языкам.
+
+    Третий элемент — размер, либо DirEntry (stat делается только для файлов, попавших
+    в таблицу правил), либо None, если размер неизвестен.
+    """
+    found = set()
+    sources = set()
+    extensions: Dict[str, int] = {}
+    language_bytes: Dict[str, int] = {}
+    file_count = 0
+    for rel, name, size in files:
+        file_count += 1
+        lower = name.lower()
+        suffix = os.path.splitext(lower)[1]
+        extensions[suffix] = extensions.get(suffix, 0) + 1
+        marker = MARKERS.get(lower)
+        if marker:
+            found.add(marker)
+        lang = SUFFIXES.get(suffix) if suffix else None
+        if lang:
+            sources.add(lang)
+        if watched is not None and (marker or name == '.gitignore'):
+            watched.append(rel)
+        lang = lang or marker
+        if lang and size is not None:
+            if not isinstance(size, int):
+                try:
+                    size = size.stat().st_size
+                except OSError:
+                    continue
+            language_bytes[lang] = language_bytes.get(lang, 0) + size
 
     return {
-        'languages': languages,
-        'file_count': len(files),
+        'languages': [lang for lang in LANGUAGE_ORDER if lang in found],
+        'file_count': file_count,
+        'source_languages': [lang for lang in LANGUAGE_ORDER if lang in sources],
+        'extensions': dict(sorted(extensions.items(), key=lambda item: (-item[1], item[0]))),
+        'language_bytes': language_bytes,
     }
 
 
+def _scan(cwd: Path, cfg: Optional[Dict], visited_dirs: Optional[List[str]] = None,
+          watched: Optional[List[str]] = None) -> dict:
+    files = ((rel, entry.name, entry) for rel, entry in iter_project_files(cwd, cfg, visited_dirs))
+    return _tally(files, watched)
+
+
+def detect_project(cwd: Path, cfg: Optional[Dict] = None) -> dict:
+    return _scan(cwd, cfg)
+
+
+@dataclass(frozen=True)
+class DetectionResult:
+    languages: List[str]
+    file_count: int
+    # маркер-файлы (относительные пути), по которым определены языки
+    markers: Dict[str, List[str]] = field(default_factory=dict)
+    # языки, исходники которых встречаются в дереве (по расширениям)
+    source_languages: List[str] = field(default_factory=list)
+    # расширение в нижнем регистре ('' — без расширения) -> число файлов
+    extensions: Dict[str, int] = field(default_factory=dict)
+    # язык -> суммарный размер его исходников и маркеров; пуст, если размеры неизвестны
+    language_bytes: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def all_languages(self) -> List[str]:
+        """Языки по маркерам и по исходникам вместе, в порядке LANGUAGE_ORDER."""
+        seen = set(self.languages) | set(self.source_languages)
+        return [lang for lang in LANGUAGE_ORDER if lang in seen]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _result(result: dict, watched: List[str]) -> DetectionResult:
+    markers: Dict[str, List[str]] = {}
+    for rel in watched:
+        lang = MARKERS.get(os.path.basename(rel).lower())
+        if lang:
+            markers.setdefault(lang, []).append(rel)
+    return DetectionResult(result['languages'], result['file_count'], markers,
+                           result['source_languages'], result['extensions'], result['language_bytes'])
+
+
+def detect(path: Union[str, Path], cfg: Optional[Dict] = None) -> DetectionResult:
+    """Библиотечный вход в детектор: только читает дерево, ничего не пишет.
+
+    В отличие от `automata run --stage detect` не создаёт .automata/ и automata.yml.
+    Без cfg берётся automata.yml проекта, если он есть. Потокобезопасна — её можно
+    звать из asyncio.to_thread.
+    """
+    cwd = Path(path)
+    if cfg is None:
+        cfg = load_config(cwd / 'automata.yml')
+    watched: List[str] = []
+    return _result(_scan(cwd, cfg, watched=watched), watched)
+
+
+def detect_paths(paths: Iterable[str], root: Optional[Union[str, Path]] = None,
+                 cfg: Optional[Dict] = None) -> DetectionResult:
+    """detect() по списку файлов, без обхода диска.
+
+    Для анализа репозитория без полного checkout: список берётся из `git ls-tree`,
+    а в root достаточно выложить маркер-файлы, .gitignore и automata.yml. Результат
+    совпадает с detect() по полному дереву, кроме language_bytes: размеров в списке нет.
+    """
+    root = Path(root) if root is not None else None
+    if cfg is None and root is not None:
+        cfg = load_config(root / 'automata.yml')
+    watched: List[str] = []
+    return _result(_tally(iter_listed_files(paths, cfg, root), watched), watched)
+
+
+def is_detection_input(rel: str) -> bool:
+    """Нужен ли файл детектору по содержимому или имени: маркеры, .gitignore, automata.yml."""
+    name = rel.rpartition('/')[2]
+    return name.lower() in MARKERS or name == '.gitignore' or rel == 'automata.yml'
+
+
+# Версия формата кэша детекции: менять при изменении правил детектора
+DETECT_CACHE_VERSION = 3
+
+
+def _git_fingerprint(cwd: Path) -> Optional[str]:
+    """HEAD-дерево каталога плюс список изменённых/неотслеживаемых файлов."""
+    tree = git_output(['rev-parse', 'HEAD:./'], cwd)
+    if tree is None:
+        return None
+    status = git_output(['status', '--porcelain', '-z', '--untracked-files=all', '--', '.', ':(exclude).automata'], cwd)
+    if status is None:
+        return None
+    return hashlib.sha1(f'{tree.strip()}\0{status}'.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def _stat_entries(cwd: Path, rels: List[str]) -> Dict[str, list]:
+    stats = {}
+    for rel in rels:
+        try:
+            st = os.stat(cwd / rel) if rel else os.stat(cwd)
+        except OSError:
+            continue
+        stats[rel] = [st.st_mtime_ns, st.st_size]
+    return stats
+
+
+def _stats_match(cwd: Path, stats: Dict[str, list], dirs: List[str]) -> bool:
+    dirs = set(dirs)
+    for rel, expected in stats.items():
+        try:
+            st = os.stat(cwd / rel) if rel else os.stat(cwd)
+        except OSError:
+            return False
+        if st.st_mtime_ns != expected[0]:
+            return False
+        # у каталогов размер зависит от ФС, сравниваем только mtime
+        if rel not in dirs and st.st_size != expected[1]:
+            return False
+    return True
+
+
+def detect_project_cached(cwd: Path, cfg: Optional[Dict] = None) -> dict:
+    """detect_project с кэшем в .automata/cache/detect.json.
+
+    Ключ — хэш дерева HEAD и `git status`; без git (или при detect.gitignore: false)
+    проверяются mtime/размеры маркер-файлов и mtime обойдённых каталогов.
+    """
+    detect_cfg = (cfg or {}).get('detect') or {}
+    cfg_key = hashlib.sha1(json.dumps(detect_cfg, sort_keys=True, default=str).encode()).hexdigest()
+    cache_path = cwd / '.automata' / 'cache' / 'detect.json'
+    cached = read_json(cache_path) or {}
+    valid = cached.get('version') == DETECT_CACHE_VERSION and cached.get('config') == cfg_key
+
+    fingerprint = _git_fingerprint(cwd) if detect_cfg.get('gitignore', True) else None
+    if fingerprint is not None:
+        if valid and cached.get('mode') == 'git' and cached.get('key') == fingerprint:
+            return cached['result']
+    elif valid and cached.get('mode') == 'stat' and _stats_match(cwd, cached.get('stats', {}), cached.get('dirs', [])):
+        return cached['result']
+
+    try:
+        # создаём каталог кэша до обхода, иначе mtime корня изменится после записи
+        store = cache_dir(cwd)
+    except OSError:
+        return detect_project(cwd, cfg)
+
+    dirs: List[str] = []
+    watched: List[str] = []
+    result = _scan(cwd, cfg, dirs, watched)
+    entry = {'version': DETECT_CACHE_VERSION, 'config': cfg_key, 'result': result}
+    if fingerprint is not None:
+        entry.update(mode='git', key=fingerprint)
+    else:
+        entry.update(mode='stat', dirs=dirs, stats=_stat_entries(cwd, dirs + watched))
+    write_json(store / 'detect.json', entry)
+    return result
@@ -0,0 +1,220 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .runners.builders import BUILDERS, _run, build_language, open_build_cache
+from .runners.deploy import deploy_project
+from .runners.process import terminate_all
+from .runners.tests import finish_tests, load_timings, run_language_tests, select_tests, shard_passed
+from .utils import trace
+
+
+class Task:
+    def __init__(self, name: str, kind: str, action: Callable[[], bool], needs: Optional[List[str]] = None):
+        self.name = name
+        self.kind = kind
+        self.action = action
+        self.needs = list(needs or [])
+        self.status = 'pending'
+        self.duration = 0.0
+
+
+def _as_list(value) -> List[str]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _shell(command: str) -> List[str]:
+    return ['cmd', '/c', command] if os.name == 'nt' else ['sh', '-c', command]
+
+
+def _section(cfg: dict, stage: str, lang: str) -> dict:
+    value = ((cfg or {}).get(stage) or {}).get(lang)
+    return value if isinstance(value, dict) else {}
+
+
+def build_graph(cwd: Path, cfg: dict, detected: dict, state: dict) -> Dict[str, Task]:
+    """Граф задач: build:<lang> -> test:<lang> -> deploy плюс задачи из секции tasks в automata.yml.
+
+    build.<lang>.needs / test.<lang>.needs добавляют зависимости к стандартным задачам;
+    timeout у задачи из tasks ограничивает время её команды в секундах.
+    """
+    tasks: Dict[str, Task] = {}
+    languages = [lang for lang in detected.get('languages', []) if lang in BUILDERS]
+
+    for lang in languages:
+        def build(lang=lang) -> bool:
+            return build_language(cwd, cfg, lang, state['cache'])
+
+        def test(lang=lang) -> bool:
+            began = time.perf_counter()
+            results = run_language_tests(cwd, cfg, lang, state['shards'], state['timings'],
+                                         state['selection'].get(lang))
+            state['results'].extend(results)
+            state['test_window'].extend([began, time.perf_counter()])
+            return all(shard_passed(r) for r in results)
+
+        tasks[f'build:{lang}'] = Task(f'build:{lang}', 'build', build, _section(cfg, 'build', lang).get('needs'))
+        tasks[f'test:{lang}'] = Task(f'test:{lang}', 'test', test,
+                                     [f'build:{lang}'] + _as_list(_section(cfg, 'test', lang).get('needs')))
+
+    def deploy() -> bool:
+        deploy_project(cwd, cfg, detected)
+        return True
+
+    tasks['deploy'] = Task('deploy', 'deploy', deploy, [f'test:{lang}' for lang in languages])
+
+    for name, spec in ((cfg or {}).get('tasks') or {}).items():
+        spec = spec if isinstance(spec, dict) else {'run': spec}
+        command = spec.get('run')
+        workdir = cwd / spec.get('cwd', '.')
+        if command is None and name in tasks:
+            # только дополнительные зависимости для стандартной задачи
+            tasks[name].needs += _as_list(spec.get('needs'))
+            continue
+
+        def custom(command=command, workdir=workdir, name=name, timeout=spec.get('timeout')) -> bool:
+            argv = _shell(command) if isinstance(command, str) else [str(part) for part in command]
+            return _run(argv, workdir, name, timeout)
+
+        tasks[name] = Task(name, spec.get('stage', 'task'), custom, _as_list(spec.get('needs')))
+    return tasks
+
+
+def _check(tasks: Dict[str, Task]) -> None:
+    for task in tasks.values():
+        unknown = [n for n in task.needs if n not in tasks]
+        if unknown:
+            raise ValueError(f"Task '{task.name}' needs unknown task(s): {', '.join(unknown)}")
+    # Алгоритм Кана: если не все задачи упорядочиваются — в графе цикл
+    indegree = {name: len(set(t.needs)) for name, t in tasks.items()}
+    ready = [name for name, n in indegree.items() if n == 0]
+    seen = 0
+    while ready:
+        current = ready.pop()
+        seen += 1
+        for t in tasks.values():
+            if current in t.needs:
+                indegree[t.name] -= 1
+                if indegree[t.name] == 0:
+                    ready.append(t.name)
+    if seen != len(tasks):
+        cyclic = sorted(name for name, n in indegree.items() if n > 0)
+        raise ValueError(f"Dependency cycle between tasks: {', '.join(cyclic)}")
+
+
+def _schedule(tasks: Dict[str, Task], pool: ThreadPoolExecutor, execute: Callable[[Task], bool]) -> None:
+    running = {}
+    while True:
+        for task in tasks.values():
+            if task.status != 'pending':
+                continue
+            states = [tasks[n].status for n in task.needs]
+            if any(s in ('failed', 'skipped') for s in states):
+                task.status = 'skipped'
+                print(f"[{task.name}] skipped: dependency failed")
+            elif all(s == 'done' for s in states):
+                task.status = 'running'
+                running[pool.submit(execute, task)] = task
+        if not running:
+            break
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            task = running.pop(future)
+            task.status = 'done' if future.result() else 'failed'
+
+
+def run_graph(tasks: Dict[str, Task], jobs: int) -> bool:
+    """Запускает каждую задачу, как только выполнены все её needs; упавшие задачи блокируют зависимые."""
+    _check(tasks)
+    tracer = trace.current()
+    start = time.perf_counter()
+
+    def execute(task: Task) -> bool:
+        began = time.perf_counter()
+        try:
+            with tracer.span(task.name, 'task', needs=task.needs):
+                return bool(task.action())
+        except Exception as e:
+            print(f"[{task.name}] failed: {e}")
+            return False
+        finally:
+            task.duration = time.perf_counter() - began
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        try:
+            _schedule(tasks, pool, execute)
+        except KeyboardInterrupt:
+            # иначе выход из пула ждал бы завершения всех запущенных команд
+            terminate_all()
+            raise
+    wall = time.perf_counter() - start
+
+    print('Task summary:')
+    for task in tasks.values():
+        print(f"  {task.name}: {task.status} ({task.duration:.2f}s)")
+    serial = sum(t.duration for t in tasks.values())
+    print(f"Pipeline wall time: {wall:.2f}s (serial sum {serial:.2f}s, critical path {' -> '.join(_critical_path(tasks))})")
+    return all(t.status == 'done' for t in tasks.values())
+
+
+def _critical_path(tasks: Dict[str, Task]) -> List[str]:
+    finish: Dict[str, float] = {}
+    best: Dict[str, Optional[str]] = {}
+
+    def visit(name: str) -> float:
+        if name not in finish:
+            task = tasks[name]
+            before = max(task.needs, key=visit, default=None)
+            best[name] = before
+            finish[name] = (finish[before] if before else 0.0) + task.duration
+        return finish[name]
+
+    if not tasks:
+        return []
+    node: Optional[str] = max(tasks, key=visit)
+    path = []
+    while node:
+        path.append(node)
+        node = best[node]
+    return path[::-1]
+
+
+def run_tasks(cwd: Path, cfg: dict, detected: dict, *, kinds: Optional[List[str]] = None, jobs: Optional[int] = None,
+              shards: Optional[int] = None, changed_since: Optional[str] = None) -> bool:
+    """Строит граф, оставляет задачи нужных видов (build/test/deploy/task) и выполняет его."""
+    pipeline_cfg = (cfg or {}).get('pipeline') or {}
+    state = {
+        'cache': None,
+        'shards': int(shards or pipeline_cfg.get('shards') or 1),
+        'timings': {},
+        'selection': {},
+        'results': [],
+        'test_window': [],
+    }
+    tasks = build_graph(cwd, cfg, detected, state)
+    if kinds is not None:
+        tasks = {name: t for name, t in tasks.items() if t.kind in kinds}
+        for t in tasks.values():
+            t.needs = [n for n in t.needs if n in tasks]
+    if not tasks:
+        return True
+
+    if any(t.kind == 'build' for t in tasks.values()):
+        state['cache'] = open_build_cache(cwd, cfg)
+    test_langs = [name.split(':', 1)[1] for name, t in tasks.items() if t.kind == 'test']
+    if test_langs:
+        state['timings'] = load_timings(cwd)
+        state['selection'] = select_tests(cwd, cfg, test_langs, changed_since)
+
+    jobs = jobs or pipeline_cfg.get('jobs') or len(tasks)
+    ok = run_graph(tasks, int(jobs))
+    if state['cache']:
+        state['cache'].save()
+    if state['results']:
+        window = state['test_window']
+        finish_tests(cwd, state['timings'], state['results'], max(window) - min(window))
+    return ok
@@ -1,41 +1,59 @@
 from pathlib import Path
+from typing import Optional
+from .utils import trace
 from .utils.config import load_config
-from .detectors import detect_project
-from .runners.builders import build_project
-from .runners.tests import test_project
-from .runners.deploy import deploy_project
+from .detectors import detect_project, detect_project_cached
+from .engine import run_tasks
 from .generators.config_generator import auto_generate_config
 
 
-def run_pipeline(*, cwd: Path, config_path: Path, stage: str = 'all') -> None:
-    # Сначала обнаруживаем языки
-    detected = detect_project(cwd)
+def run_pipeline(*, cwd: Path, config_path: Path, stage: str = 'all', use_cache: bool = True,
+                 jobs: Optional[int] = None, shards: Optional[int] = None,
+                 changed_since: Optional[str] = None, trace_path: Optional[Path] = None) -> bool:
+    """Запускает конвейер; False, если какая-либо задача упала или была пропущена."""
+    tracer = trace.start()
+    cfg = {}
+    try:
+        with tracer.span('pipeline', 'stage', stage=stage):
+            cfg, ok = _run_stages(cwd, config_path, stage, use_cache, jobs, shards, changed_since)
+        return ok
+    finally:
+        # Трасса пишется и при падении конвейера — так виден шаг, на котором всё остановилось
+        path = trace_path or cwd / (((cfg or {}).get('pipeline') or {}).get('trace') or '.automata/trace.json')
+        try:
+            tracer.write(path)
+            if stage != 'detect':
+                print(f"Pipeline trace: {path}")
+        except OSError as e:
+            if stage != 'detect':
+                print(f"Could not write trace {path}: {e}")
+
+
+def _run_stages(cwd: Path, config_path: Path, stage: str, use_cache: bool, jobs: Optional[int],
+                shards: Optional[int], changed_since: Optional[str]) -> tuple[dict, bool]:
+    tracer = trace.current()
+    # Сначала обнаруживаем языки (с учётом detect.ignore из конфига, если он есть)
+    cfg = load_config(config_path)
+    with tracer.span('detect', 'stage', cached=use_cache) as span:
+        detected = detect_project_cached(cwd, cfg) if use_cache else detect_project(cwd, cfg)
+        span.update(detected)
     
     # Автоматически генерируем конфиг если его нет
     if not config_path.exists():
         print("No config found, auto-generating...")
         auto_generate_config(cwd, detected, force=True)
         config_path = cwd / 'automata.yml'
-    
-    cfg = load_config(config_path)
+        cfg = load_config(config_path)
 
     if stage == 'detect':
         import json
         print(json.dumps(detected, indent=2))
-        return
-
-    skip_build = stage not in ('all', 'build')
-    skip_test = stage not in ('all', 'test')
-    skip_deploy = stage not in ('all', 'deploy')
-
-    build_project(cwd, cfg, detected, skip=skip_build)
-    if stage == 'build':
-        return
-
-    test_project(cwd, cfg, detected, skip=skip_test)
-    if stage == 'test':
-        return
-
-    deploy_project(cwd, cfg, detected, skip=skip_deploy)
-
-
+        return cfg, True
+
+    # build:<lang> -> test:<lang> -> deploy выполняются как граф задач: тесты языка
+    # стартуют сразу после его сборки, не дожидаясь остальных языков
+    kinds = None if stage == 'all' else [stage]
+    ok = run_tasks(cwd, cfg, detected, kinds=kinds, jobs=jobs, shards=shards, changed_since=changed_since)
+    if not ok:
+        print("Pipeline finished with failed or skipped tasks")
+    return cfg, ok
@@ -0,0 +1,242 @@
+import ast
+import posixpath
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from ..detectors import iter_project_files
+from ..utils.cache import git_output
+
+
+# Расширения исходников по языкам; изменения в чужих исходниках язык не затрагивают
+SOURCE_SUFFIXES = {
+    'python': ('.py',),
+    'go': ('.go',),
+    'node': ('.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx'),
+    'java': ('.java', '.kt', '.kts'),
+    'rust': ('.rs',),
+}
+
+# Файлы, изменение которых не влияет на тесты ни одного языка
+NEUTRAL_SUFFIXES = ('.md', '.rst', '.adoc', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp')
+NEUTRAL_NAMES = ('license', 'license.txt', '.gitignore', '.dockerignore', 'dockerfile', 'automata.yml')
+
+# Файлы, влияющие на все тесты языка целиком
+GLOBAL_NAMES = {
+    'python': ('conftest.py', 'pytest.ini', 'setup.cfg', 'tox.ini', 'pyproject.toml', 'requirements.txt', 'setup.py'),
+    'go': ('go.mod', 'go.sum'),
+    'node': ('package.json', 'package-lock.json', 'yarn.lock', 'tsconfig.json'),
+}
+
+
+def changed_files(cwd: Path, ref: str) -> Optional[List[str]]:
+    """Файлы (относительно cwd), изменённые с ref, включая незакоммиченные и неотслеживаемые."""
+    diff = git_output(['diff', '--name-only', '--relative', ref, '--'], cwd)
+    if diff is None:
+        return None
+    untracked = git_output(['ls-files', '--others', '--exclude-standard'], cwd) or ''
+    return sorted({line.strip() for line in (diff + untracked).splitlines() if line.strip()})
+
+
+def _reverse_closure(graph: Dict[str, Set[str]], start: Iterable[str]) -> Set[str]:
+    """Все узлы, которые прямо или транзитивно зависят от start."""
+    reverse: Dict[str, Set[str]] = {}
+    for node, deps in graph.items():
+        for dep in deps:
+            reverse.setdefault(dep, set()).add(node)
+    seen = set(start)
+    stack = list(seen)
+    while stack:
+        for parent in reverse.get(stack.pop(), ()):
+            if parent not in seen:
+                seen.add(parent)
+                stack.append(parent)
+    return seen
+
+
+def is_python_test(name: str) -> bool:
+    return name.endswith('.py') and (name.startswith('test_') or name.endswith('_test.py'))
+
+
+def _python_module_names(rel: str) -> List[str]:
+    parts = rel[:-3].split('/')
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    names = ['.'.join(parts)] if parts else []
+    # раскладка src/: пакет импортируется без префикса src
+    if len(parts) > 1 and parts[0] == 'src':
+        names.append('.'.join(parts[1:]))
+    return names
+
+
+def _python_imports(cwd: Path, rel: str) -> Optional[Set[str]]:
+    try:
+        tree = ast.parse((cwd / rel).read_bytes(), filename=rel)
+    except (OSError, SyntaxError, ValueError):
+        return None
+    package = rel[:-3].split('/')[:-1]
+    found = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            found.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                depth = len(package) - node.level + 1
+                if depth < 0:
+                    continue
+                module = '.'.join(package[:depth] + ([node.module] if node.module else []))
+            else:
+                module = node.module or ''
+            if module:
+                found.add(module)
+                found.update(f'{module}.{alias.name}' for alias in node.names)
+    return found
+
+
+def _python_select(cwd: Path, files: List[str], tests: List[str], changed: List[str]) -> Optional[List[str]]:
+    modules: Dict[str, str] = {}
+    for rel in files:
+        for name in _python_module_names(rel):
+            modules.setdefault(name, rel)
+
+    graph: Dict[str, Set[str]] = {}
+    for rel in files:
+        imports = _python_imports(cwd, rel)
+        if imports is None:
+            return None
+        deps = set()
+        for name in imports:
+            # import a.b.c загружает и пакеты a, a.b
+            parts = name.split('.')
+            for i in range(1, len(parts) + 1):
+                target = modules.get('.'.join(parts[:i]))
+                if target and target != rel:
+                    deps.add(target)
+        graph[rel] = deps
+
+    affected = _reverse_closure(graph, [rel for rel in changed if rel in graph])
+    return [t for t in tests if t in affected]
+
+
+GO_IMPORT_BLOCK = re.compile(r'^import\s*\((.*?)\)', re.S | re.M)
+GO_IMPORT_LINE = re.compile(r'^import\s+(?:[\w.]+\s+)?"([^"]+)"', re.M)
+GO_QUOTED = re.compile(r'"([^"]+)"')
+
+
+def _go_select(cwd: Path, files: List[str], changed: List[str]) -> Optional[List[str]]:
+    try:
+        gomod = (cwd / 'go.mod').read_text(encoding='utf-8')
+    except OSError:
+        return None
+    match = re.search(r'^module\s+(\S+)', gomod, re.M)
+    if not match:
+        return None
+    module = match.group(1)
+
+    def import_path(directory: str) -> str:
+        return f'{module}/{directory}' if directory else module
+
+    graph: Dict[str, Set[str]] = {}
+    with_tests: Set[str] = set()
+    for rel in files:
+        pkg = import_path(posixpath.dirname(rel))
+        try:
+            source = (cwd / rel).read_text(encoding='utf-8', errors='ignore')
+        except OSError:
+            return None
+        imports = set(GO_IMPORT_LINE.findall(source))
+        for block in GO_IMPORT_BLOCK.findall(source):
+            imports.update(GO_QUOTED.findall(block))
+        deps = graph.setdefault(pkg, set())
+        deps.update(i for i in imports if i == module or i.startswith(module + '/'))
+        deps.discard(pkg)
+        if rel.endswith('_test.go'):
+            with_tests.add(pkg)
+
+    start = [import_path(posixpath.dirname(rel)) for rel in changed]
+    affected = _reverse_closure(graph, start)
+    return sorted(p for p in affected if p in with_tests)
+
+
+NODE_IMPORT = re.compile(r'''(?:require\(\s*|import\s*\(\s*|from\s+|import\s+)['"](\.{1,2}/[^'"]+)['"]''')
+NODE_TEST = re.compile(r'(\.(test|spec)\.[cm]?[jt]sx?$)|(^|/)__tests__/')
+
+
+def _node_resolve(rel_dir: str, spec: str, known: Set[str]) -> Optional[str]:
+    base = posixpath.normpath(posixpath.join(rel_dir, spec))
+    for candidate in [base] + [base + s for s in SOURCE_SUFFIXES['node']] + \
+            [f'{base}/index{s}' for s in SOURCE_SUFFIXES['node']]:
+        if candidate in known:
+            return candidate
+    return None
+
+
+def _node_select(cwd: Path, files: List[str], changed: List[str]) -> Optional[List[str]]:
+    known = set(files)
+    graph: Dict[str, Set[str]] = {}
+    for rel in files:
+        try:
+            source = (cwd / rel).read_text(encoding='utf-8', errors='ignore')
+        except OSError:
+            return None
+        deps = set()
+        for spec in NODE_IMPORT.findall(source):
+            target = _node_resolve(posixpath.dirname(rel), spec, known)
+            if target:
+                deps.add(target)
+        graph[rel] = deps
+    affected = _reverse_closure(graph, [rel for rel in changed if rel in known])
+    return sorted(rel for rel in affected if NODE_TEST.search(rel))
+
+
+def _classify(changed: List[str], lang: str) -> Optional[List[str]]:
+    """Оставляет исходники языка; None, если есть изменение, которое нельзя отнести к коду."""
+    own = []
+    for rel in changed:
+        name = posixpath.basename(rel).lower()
+        if name in GLOBAL_NAMES.get(lang, ()):
+            return None
+        if rel.endswith(SOURCE_SUFFIXES.get(lang, ())):
+            own.append(rel)
+        elif rel.lower().endswith(NEUTRAL_SUFFIXES) or name in NEUTRAL_NAMES:
+            continue
+        elif any(rel.endswith(suffixes) for suffixes in SOURCE_SUFFIXES.values()):
+            continue
+        else:
+            return None
+    return own
+
+
+def select_affected(cwd: Path, cfg: dict, languages: List[str], ref: str) -> Dict[str, Optional[List[str]]]:
+    """Для каждого языка: None — гонять весь набор, [] — пропустить, иначе список целей."""
+    changed = changed_files(cwd, ref)
+    if changed is None:
+        return {lang: None for lang in languages}
+
+    by_suffix: Dict[str, List[str]] = {}
+    for rel, _ in iter_project_files(cwd, cfg):
+        for lang, suffixes in SOURCE_SUFFIXES.items():
+            if rel.endswith(suffixes):
+                by_suffix.setdefault(lang, []).append(rel)
+
+    selection: Dict[str, Optional[List[str]]] = {}
+    for lang in languages:
+        own = _classify(changed, lang) if lang in SOURCE_SUFFIXES else None
+        if own is not None and not own:
+            selection[lang] = []
+            continue
+        # удалённый файл мог импортироваться кем угодно — граф по нему не построить
+        if own is None or any(not (cwd / rel).exists() for rel in own):
+            selection[lang] = None
+            continue
+        files = by_suffix.get(lang, [])
+        if lang == 'python':
+            tests = [rel for rel in files if is_python_test(posixpath.basename(rel))]
+            selection[lang] = _python_select(cwd, files, tests, own)
+        elif lang == 'go':
+            selection[lang] = _go_select(cwd, files, own)
+        elif lang == 'node':
+            selection[lang] = _node_select(cwd, files, own)
+        else:
+            selection[lang] = None
+    return selection
@@ -1,53 +1,116 @@
-import subprocess
+import shutil
 from pathlib import Path
+from typing import Optional
 
+from ..utils import trace
+from ..utils.build_cache import DEFAULT_MAX_BYTES, BuildCache
+from .process import emit as _emit, prefixed, run_sync
+
+
+def _run(cmd: list[str], cwd: Path, prefix: str, timeout: Optional[float] = None) -> bool:
+    result = run_sync(cmd, cwd, on_line=prefixed(prefix), merge_stderr=True, timeout=timeout,
+                      category='build', language=prefix)
+    if result.error:
+        _emit(prefix, f"{' '.join(cmd)}: {result.error}")
+    elif result.timed_out:
+        _emit(prefix, f"{' '.join(cmd)} timed out after {timeout}s")
+    elif not result.ok:
+        _emit(prefix, f"{' '.join(cmd)} exited with {result.returncode}")
+    return result.ok
+
+
+def _step(ctx: dict, name: str, cmds: list[list[str]], inputs: list[str],
+          outputs: Optional[list[str]] = None, extra: str = '') -> bool:
+    """Запускает шаг сборки, если его входы или выходы изменились с прошлого успешного запуска.
+
+    Шаг считается успешным, если успешна его последняя команда; пропущенный шаг — успешен.
+    """
+    cwd, lang, cache = ctx['cwd'], ctx['lang'], ctx['cache']
+    lang_cfg = ctx['lang_cfg']
+    if ctx['main'] == name:
+        inputs = lang_cfg.get('inputs') or inputs
+        outputs = lang_cfg.get('outputs') if 'outputs' in lang_cfg else outputs
+    outputs = [outputs] if isinstance(outputs, str) else list(outputs or [])
+    step_key = f'{lang}.{name}'
+    digest = cache.input_hash(step_key, inputs, extra, outputs) if cache and inputs else None
+    if digest and cache.is_fresh(step_key, digest, outputs):
+        _emit(lang, f'{name}: inputs unchanged, skipped')
+        trace.current().add(step_key, 'build', trace.current().now(), trace.current().now(), {'skipped': True})
+        return True
+    ok = False
+    for cmd in cmds:
+        ok = _run(cmd, cwd, lang)
+    if ok and digest:
+        cache.record(step_key, digest, outputs)
+    return ok
 
-def _run(cmd: list[str], cwd: Path) -> None:
-    try:
-        subprocess.run(cmd, cwd=str(cwd), check=True)
-    except Exception:
-        pass
 
+NODE_LOCKFILES = ['package.json', 'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock']
 
-def build_node(cwd: Path) -> None:
-    _run(['npm', 'ci'], cwd)
-    _run(['npm', 'install'], cwd)
-    _run(['npm', 'run', 'build', '--if-present'], cwd)
 
+def build_node(ctx: dict) -> bool:
+    if not _step(ctx, 'install', [['npm', 'ci'], ['npm', 'install']], NODE_LOCKFILES, ['node_modules']):
+        return False
+    # Без явных inputs в automata.yml сборка node запускается всегда
+    return _step(ctx, 'build', [['npm', 'run', 'build', '--if-present']], [])
 
-def build_python(cwd: Path) -> None:
-    if (cwd / 'requirements.txt').exists():
-        _run(['pip', 'install', '-r', 'requirements.txt'], cwd)
 
+def build_python(ctx: dict) -> bool:
+    if not (ctx['cwd'] / 'requirements.txt').exists():
+        return True
+    return _step(ctx, 'install', [['pip', 'install', '-r', 'requirements.txt']], ['requirements.txt'],
+                 extra=shutil.which('pip') or '')
 
-def build_java(cwd: Path) -> None:
-    if (cwd / 'pom.xml').exists():
-        _run(['mvn', '-B', 'package', '-DskipTests'], cwd)
-    else:
-        _run(['gradle', 'build', '-x', 'test'], cwd)
 
+def build_java(ctx: dict) -> bool:
+    sources = ['src', 'settings.gradle', 'settings.gradle.kts']
+    if (ctx['cwd'] / 'pom.xml').exists():
+        return _step(ctx, 'package', [['mvn', '-B', 'package', '-DskipTests']], ['pom.xml'] + sources, ['target'])
+    return _step(ctx, 'package', [['gradle', 'build', '-x', 'test']],
+                 ['build.gradle', 'build.gradle.kts'] + sources, ['build'])
 
-def build_go(cwd: Path) -> None:
-    _run(['go', 'build', './...'], cwd)
 
+def build_go(ctx: dict) -> bool:
+    return _step(ctx, 'build', [['go', 'build', './...']], ['go.mod', 'go.sum', '*.go'])
 
-def build_rust(cwd: Path) -> None:
-    _run(['cargo', 'build', '--release'], cwd)
 
+def build_rust(ctx: dict) -> bool:
+    return _step(ctx, 'build', [['cargo', 'build', '--release']], ['Cargo.toml', 'Cargo.lock', '*.rs'],
+                 ['target/release'])
 
-def build_project(cwd: Path, cfg: dict, detected: dict, *, skip: bool = False) -> None:
-    if skip:
-        return
-    for lang in detected.get('languages', []):
-        if lang == 'node':
-            build_node(cwd)
-        elif lang == 'python':
-            build_python(cwd)
-        elif lang == 'java':
-            build_java(cwd)
-        elif lang == 'go':
-            build_go(cwd)
-        elif lang == 'rust':
-            build_rust(cwd)
 
+BUILDERS = {
+    'node': build_node,
+    'python': build_python,
+    'java': build_java,
+    'go': build_go,
+    'rust': build_rust,
+}
+
+
+MAIN_STEPS = {'node': 'build', 'python': 'install', 'java': 'package', 'go': 'build', 'rust': 'build'}
+
+
+def open_build_cache(cwd: Path, cfg: dict) -> Optional[BuildCache]:
+    pipeline_cfg = (cfg or {}).get('pipeline') or {}
+    if not pipeline_cfg.get('build_cache', True):
+        return None
+    try:
+        return BuildCache(cwd, cfg, int(pipeline_cfg.get('build_cache_bytes') or DEFAULT_MAX_BYTES))
+    except OSError:
+        return None
+
+
+def build_language(cwd: Path, cfg: dict, lang: str, cache: Optional[BuildCache] = None) -> bool:
+    """Собирает один язык; False, если какой-либо шаг сборки завершился с ошибкой."""
+    lang_cfg = ((cfg or {}).get('build') or {}).get(lang)
+    ctx = {
+        'cwd': cwd,
+        'lang': lang,
+        'cache': cache,
+        'lang_cfg': lang_cfg if isinstance(lang_cfg, dict) else {},
+        'main': MAIN_STEPS[lang],
+    }
+    with trace.current().span(f'build:{lang}', 'stage'):
+        return BUILDERS[lang](ctx)
 
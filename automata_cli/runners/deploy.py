@@ -1,12 +1,15 @@
-import subprocess
 from pathlib import Path
 
+from .process import prefixed, run_sync
 
-def _run(cmd: list[str], cwd: Path) -> None:
-    try:
-        subprocess.run(cmd, cwd=str(cwd), check=True)
-    except Exception:
-        pass
+
+def _run(cmd: list[str], cwd: Path) -> int:
+    result = run_sync(cmd, cwd, on_line=prefixed('deploy'), merge_stderr=True, category='deploy')
+    if result.error:
+        print(f"{' '.join(cmd)}: {result.error}")
+    elif not result.ok:
+        print(f"{' '.join(cmd)} exited with {result.returncode}")
+    return result.returncode
 
 
 def _deploy_docker(cwd: Path, cfg: dict) -> None:
@@ -0,0 +1,229 @@
+import asyncio
+import concurrent.futures
+import inspect
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from ..utils import trace
+
+# Сколько последних строк вывода хранится для отчёта об ошибке
+DEFAULT_TAIL_LINES = 200
+# Максимальная длина строки; более длинные строки отбрасываются
+LINE_LIMIT = 1024 * 1024
+# Сколько прочитанных кусков (до 64 КБ) пайпа ждут разбора; дальше поток чтения ждёт
+PIPE_QUEUE_CHUNKS = 16
+# Сколько ждать после SIGTERM перед SIGKILL
+KILL_GRACE = 5.0
+
+LineCallback = Callable[[str, str], Union[None, Awaitable[None]]]
+
+
+_print_lock = threading.Lock()
+
+# Группы запущенных процессов: их можно прервать из главного потока (Ctrl+C)
+_live_lock = threading.Lock()
+_live: set = set()
+
+
+def emit(prefix: str, line: str) -> None:
+    with _print_lock:
+        print(f'[{prefix}] {line}', flush=True)
+
+
+def prefixed(prefix: str) -> LineCallback:
+    """Колбэк, печатающий строки с префиксом задачи; строки параллельных задач не перемешиваются."""
+    return lambda stream, line: emit(prefix, line)
+
+
+class ProcessResult:
+    def __init__(self, cmd: List[str]):
+        self.cmd = cmd
+        self.returncode = -1
+        self.duration = 0.0
+        self.timed_out = False
+        self.error: Optional[str] = None
+        self.cpu: Optional[float] = None
+        self.peak_rss_kb: Optional[int] = None
+        self.tail: Deque[Tuple[str, str]] = deque()
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+    def tail_text(self) -> str:
+        return '\n'.join(line for _, line in self.tail)
+
+
+def _reap(proc: subprocess.Popen) -> Tuple[Optional[float], Optional[int]]:
+    """Дожидается процесса через wait4 (в рабочем потоке) и возвращает его CPU-время и пиковый RSS.
+
+    rusage из wait4 включает дождавшихся потомков, поэтому обёртки вроде `sh -c` и npm
+    учитываются целиком. Где wait4 нет, (None, None).
+    """
+    if not hasattr(os, 'wait4'):
+        proc.wait()
+        return None, None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+def _feed(pipe, chunks: asyncio.Queue, loop: asyncio.AbstractEventLoop, closed: threading.Event) -> None:
+    """Передаёт вывод пайпа в очередь цикла событий (None — конец); выполняется в отдельном потоке.
+
+    Очередь ограничена: пока on_line не успевает, поток ждёт, а не копит вывод в памяти,
+    и процесс упирается в заполненный пайп.
+    """
+    try:
+        with pipe:
+            for chunk in iter(lambda: pipe.read1(65536), b''):
+                asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+                if closed.is_set():
+                    return
+            asyncio.run_coroutine_threadsafe(chunks.put(None), loop).result()
+    except (RuntimeError, concurrent.futures.CancelledError):
+        # цикл событий уже закрыт — вывод больше никто не читает
+        pass
+
+
+async def _pump(chunks: asyncio.Queue, name: str, result: ProcessResult,
+                on_line: Optional[LineCallback]) -> None:
+    async def handle(raw: bytes) -> None:
+        line = raw.decode(errors='replace').rstrip('\r')
+        result.tail.append((name, line))
+        if on_line is not None:
+            ret = on_line(name, line)
+            if inspect.isawaitable(ret):
+                await ret
+
+    buffer = b''
+    too_long = False
+    while True:
+        chunk = await chunks.get()
+        if chunk is None:
+            if buffer and not too_long:
+                await handle(buffer)
+            return
+        *lines, buffer = (buffer + chunk).split(b'\n')
+        for raw in lines:
+            if too_long:
+                too_long = False
+                continue
+            await handle(raw)
+        if len(buffer) > LINE_LIMIT:
+            # строка длиннее LINE_LIMIT отбрасывается целиком
+            buffer = b''
+            too_long = True
+
+
+def _signal(pid: int, sig: int) -> None:
+    # процесс запущен в своей сессии: сигнал получает вся группа, включая потомков `sh -c`
+    try:
+        if os.name == 'nt':
+            os.kill(pid, sig)
+        else:
+            os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _stop(proc: subprocess.Popen, reaped: asyncio.Future) -> None:
+    if reaped.done():
+        return
+    _signal(proc.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(asyncio.shield(reaped), KILL_GRACE)
+        return
+    except asyncio.TimeoutError:
+        pass
+    _signal(proc.pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+    await reaped
+
+
+def terminate_all() -> None:
+    """Останавливает все процессы, запущенные через run_process (например, при Ctrl+C)."""
+    with _live_lock:
+        pids = list(_live)
+    for pid in pids:
+        _signal(pid, signal.SIGTERM)
+
+
+async def run_process(cmd: List[str], cwd: Path, *, env: Optional[Dict[str, str]] = None,
+                      on_line: Optional[LineCallback] = None, timeout: Optional[float] = None,
+                      merge_stderr: bool = False, tail_lines: int = DEFAULT_TAIL_LINES,
+                      category: str = 'process', **trace_args) -> ProcessResult:
+    """Запускает процесс и построчно отдаёт его вывод в on_line(stream, line).
+
+    stream — 'stdout' или 'stderr' (при merge_stderr всё идёт как 'stdout'). В памяти остаются
+    только последние tail_lines строк. По таймауту или отмене задачи процесс получает SIGTERM,
+    затем SIGKILL; отмена пробрасывается дальше как CancelledError.
+    """
+    result = ProcessResult(list(cmd))
+    result.tail = deque(maxlen=tail_lines)
+    tracer = trace.current()
+    start = tracer.now()
+    try:
+        proc = subprocess.Popen(
+            cmd, cwd=str(cwd), env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+            start_new_session=os.name != 'nt')
+    except OSError as e:
+        result.error = str(e)
+        trace.traced_process(result.cmd, category, start, -1, None, None, error=str(e), **trace_args)
+        return result
+
+    # Процесс ждёт рабочий поток (wait4 даёт rusage), пайпы читают потоки-передатчики,
+    # а строки разбираются и отдаются в on_line в цикле событий
+    loop = asyncio.get_running_loop()
+    reaped = asyncio.ensure_future(asyncio.to_thread(_reap, proc))
+    workers = []
+    queues = []
+    closed = threading.Event()
+    for name, pipe in (('stdout', proc.stdout), ('stderr', proc.stderr)):
+        if pipe is None:
+            continue
+        chunks: asyncio.Queue = asyncio.Queue(PIPE_QUEUE_CHUNKS)
+        queues.append(chunks)
+        threading.Thread(target=_feed, args=(pipe, chunks, loop, closed), daemon=True).start()
+        workers.append(asyncio.ensure_future(_pump(chunks, name, result, on_line)))
+    with _live_lock:
+        _live.add(proc.pid)
+    try:
+        await asyncio.wait_for(asyncio.gather(*workers, asyncio.shield(reaped)), timeout)
+    except asyncio.TimeoutError:
+        result.timed_out = True
+        await _stop(proc, reaped)
+    except asyncio.CancelledError:
+        await _stop(proc, reaped)
+        raise
+    finally:
+        # процесс дожидаемся в любом случае, иначе поток с wait4 и сам процесс останутся висеть
+        await _stop(proc, reaped)
+        with _live_lock:
+            _live.discard(proc.pid)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # освобождаем место в очередях, чтобы потоки чтения не остались ждать разбора
+        closed.set()
+        for chunks in queues:
+            while not chunks.empty():
+                chunks.get_nowait()
+        result.cpu, result.peak_rss_kb = reaped.result()
+        result.returncode = proc.returncode if proc.returncode is not None else -1
+        result.duration = time.perf_counter() - start
+        extra = dict(trace_args, timed_out=True) if result.timed_out else trace_args
+        trace.traced_process(result.cmd, category, start, result.returncode,
+                             result.cpu, result.peak_rss_kb, **extra)
+    return result
+
+
+def run_sync(cmd: List[str], cwd: Path, **kwargs) -> ProcessResult:
+    """run_process для синхронного кода (потоки сборки и тестов): у каждого вызова свой цикл событий."""
+    return asyncio.run(run_process(cmd, cwd, **kwargs))
@@ -1,30 +1,282 @@
+import heapq
 import os
+import re
+import shutil
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
+from xml.etree import ElementTree
 
+from .affected import select_affected
+from ..utils.cache import CACHE_DIR, cache_dir, read_json, write_json
+from .process import ProcessResult, emit, run_sync
 
-def _run(cmd: list[str], cwd: Path) -> None:
+# Сколько последних строк вывода упавшего шарда попадает в test-report.json
+REPORT_TAIL_LINES = 50
+# Код выхода «не найдено ни одного теста» — проект без тестов не считается упавшим
+NO_TESTS_EXIT = {'python': 5}
+
+
+def _test_env(cwd: Path) -> dict:
+    env = os.environ.copy()
+    env['PYTHONPATH'] = str(cwd) + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def _run(cmd: list[str], cwd: Path, prefix: str, on_line=None) -> ProcessResult:
+    env = _test_env(cwd)
+
+    def show(stream: str, line: str) -> None:
+        emit(prefix, line)
+        if on_line is not None:
+            on_line(line)
+
+    result = run_sync(cmd, cwd, env=env, on_line=show, merge_stderr=True, tail_lines=REPORT_TAIL_LINES,
+                      category='test', shard=prefix)
+    if result.error:
+        emit(prefix, f"{' '.join(cmd)}: {result.error}")
+    return result
+
+
+def python_test_files(cwd: Path) -> list[str]:
+    """Файлы с тестами, которые соберёт сам pytest (его testpaths, norecursedirs, conftest).
+
+    Если сбор не удался, возвращается пустой список — тогда набор гоняется одним шардом,
+    как без --shards.
+    """
+    try:
+        result = subprocess.run(['pytest', '--collect-only', '-q'], cwd=str(cwd), env=_test_env(cwd),
+                                capture_output=True, text=True)
+    except Exception:
+        return []
+    if result.returncode != 0:
+        return []
+    files = {line.split('::', 1)[0] for line in result.stdout.splitlines() if '::' in line}
+    # id тестов считаются от rootdir pytest — если он выше проекта, пути отсюда не годятся
+    if not all((cwd / rel).is_file() for rel in files):
+        return []
+    return sorted(files)
+
+
+def go_packages(cwd: Path) -> list[str]:
     try:
-        env = os.environ.copy()
-        env['PYTHONPATH'] = str(cwd) + os.pathsep + env.get('PYTHONPATH', '')
-        subprocess.run(cmd, cwd=str(cwd), check=True, env=env)
+        result = subprocess.run(['go', 'list', './...'], cwd=str(cwd), capture_output=True, text=True)
     except Exception:
+        return []
+    if result.returncode != 0:
+        return []
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+def load_timings(cwd: Path) -> dict:
+    return read_json(cwd / CACHE_DIR / 'test_timings.json') or {}
+
+
+def save_timings(cwd: Path, timings: dict, results: list[dict]) -> None:
+    """Обновляет базу длительностей (скользящее среднее по прошлым запускам)."""
+    for r in results:
+        known = timings.setdefault(r['language'], {})
+        for target, seconds in r.get('timings', {}).items():
+            old = known.get(target)
+            known[target] = round(seconds if old is None else (old + seconds) / 2, 4)
+    try:
+        write_json(cache_dir(cwd) / 'test_timings.json', timings)
+    except OSError:
         pass
 
 
-def test_project(cwd: Path, cfg: dict, detected: dict, *, skip: bool = False) -> None:
-    if skip:
-        return
-    for lang in detected.get('languages', []):
-        if lang == 'node':
-            _run(['npm', 'test', '--silent', '--if-present'], cwd)
-        elif lang == 'python':
-            _run(['pytest', '-q'], cwd)
-        elif lang == 'java':
-            _run(['mvn', '-B', 'test'], cwd)
-        elif lang == 'go':
-            _run(['go', 'test', './...'], cwd)
-        elif lang == 'rust':
-            _run(['cargo', 'test', '--all'], cwd)
+def balance_shards(targets: list[str], shards: int, durations: dict) -> list[list[str]]:
+    """LPT: самые долгие цели первыми кладутся в наименее загруженный шард.
+
+    Для целей без истории берётся медиана известных длительностей.
+    """
+    known = sorted(durations[t] for t in targets if t in durations)
+    default = known[len(known) // 2] if known else 1.0
+    weight = {t: durations.get(t, default) for t in targets}
+    heap = [(0.0, i, []) for i in range(max(1, min(shards, len(targets))))]
+    for target in sorted(targets, key=lambda t: (-weight[t], t)):
+        load, i, bucket = heapq.heappop(heap)
+        bucket.append(target)
+        heapq.heappush(heap, (load + weight[target], i, bucket))
+    return [sorted(bucket) for _, _, bucket in sorted(heap, key=lambda item: item[1]) if bucket]
+
+
+def plan_language(cwd: Path, cfg: dict, lang: str, shards: int, timings: dict,
+                  selected: Optional[list[str]] = None) -> list[dict]:
+    """Возвращает шарды языка: команда плюс список целей (файлов/пакетов), которые она покрывает.
+
+    selected — цели, отобранные по изменениям (None — весь набор, [] — пропустить язык).
+    """
+    durations = timings.get(lang, {})
+    if selected is not None and not selected:
+        return []
+    if lang == 'python':
+        if selected is not None:
+            return [{'cmd': ['pytest', '-q'] + part, 'targets': part}
+                    for part in balance_shards(selected, shards, durations)]
+        files = python_test_files(cwd) if shards > 1 else []
+        if len(files) > 1:
+            return [{'cmd': ['pytest', '-q'] + part, 'targets': part}
+                    for part in balance_shards(files, shards, durations)]
+        return [{'cmd': ['pytest', '-q'], 'targets': []}]
+    if lang == 'go':
+        packages = selected if selected is not None else (go_packages(cwd) if shards > 1 else [])
+        if len(packages) > 1 or selected is not None:
+            return [{'cmd': ['go', 'test'] + part, 'targets': part}
+                    for part in balance_shards(packages, shards, durations)]
+        return [{'cmd': ['go', 'test', './...'], 'targets': []}]
+    if lang == 'node':
+        if selected is not None:
+            return [{'cmd': ['npm', 'test', '--silent', '--if-present', '--'] + selected, 'targets': selected}]
+        return [{'cmd': ['npm', 'test', '--silent', '--if-present'], 'targets': []}]
+    if lang == 'java':
+        return [{'cmd': ['mvn', '-B', 'test'], 'targets': []}]
+    if lang == 'rust':
+        return [{'cmd': ['cargo', 'test', '--all'], 'targets': []}]
+    return []
+
+
+GO_RESULT = re.compile(r'^(?:ok|FAIL)\s+(\S+)\s+([\d.]+)s')
+
+
+def _junit_timings(path: Path) -> dict:
+    timings: dict = {}
+    try:
+        root = ElementTree.parse(path).getroot()
+    except (OSError, ElementTree.ParseError):
+        return timings
+    for case in root.iter('testcase'):
+        file = case.get('file')
+        if file:
+            file = file.replace(os.sep, '/')
+            timings[file] = timings.get(file, 0.0) + float(case.get('time') or 0)
+    return timings
+
+
+def _run_shard(cwd: Path, lang: str, index: int, total: int, shard: dict) -> dict:
+    prefix = f'{lang}#{index + 1}' if total > 1 else lang
+    cmd = list(shard['cmd'])
+    junit = None
+    if lang == 'python':
+        junit = cache_dir(cwd) / f'junit-{index + 1}.xml'
+        cmd += [f'--junitxml={junit}', '-o', 'junit_family=xunit1']
+    go_results: dict = {}
+
+    def collect(line: str) -> None:
+        # go test печатает по строке ok/FAIL на пакет — весь вывод хранить не нужно
+        match = GO_RESULT.match(line)
+        if match:
+            go_results[match.group(1)] = float(match.group(2))
+
+    start = time.perf_counter()
+    result = _run(cmd, cwd, prefix, collect if lang == 'go' else None)
+    duration = time.perf_counter() - start
+
+    if junit is not None:
+        timings = _junit_timings(junit)
+        try:
+            junit.unlink()
+        except OSError:
+            pass
+    elif lang == 'go':
+        timings = go_results
+    else:
+        timings = {}
+    if not timings and len(shard['targets']) == 1:
+        timings = {shard['targets'][0]: duration}
+    skipped = None
+    if result.error and shutil.which(cmd[0]) is None:
+        skipped = f'{cmd[0]} not found'
+    elif result.returncode == NO_TESTS_EXIT.get(lang):
+        skipped = 'no tests collected'
+    if skipped:
+        emit(prefix, f'{skipped}, skipped')
+    return {
+        'language': lang,
+        'shard': index + 1,
+        'shards': total,
+        'command': shard['cmd'],
+        'targets': shard['targets'],
+        'returncode': result.returncode,
+        'skipped': skipped,
+        'duration': duration,
+        'timings': timings,
+        'output_tail': [] if result.ok else [line for _, line in result.tail],
+    }
+
+
+def shard_passed(result: dict) -> bool:
+    """Шард прошёл или пропущен (нет тестов / нет тест-раннера) — это не повод блокировать deploy."""
+    return result['returncode'] == 0 or bool(result['skipped'])
+
+
+def _report(results: list[dict], wall: float) -> dict:
+    by_lang: dict = {}
+    for r in results:
+        lang = by_lang.setdefault(r['language'], {'shards': 0, 'failed': 0, 'skipped': 0, 'duration': 0.0})
+        lang['shards'] += 1
+        lang['duration'] += r['duration']
+        if r['skipped']:
+            lang['skipped'] += 1
+        elif r['returncode'] != 0:
+            lang['failed'] += 1
+
+    print('Test summary:')
+    for name, info in by_lang.items():
+        status = 'FAILED' if info['failed'] else 'skipped' if info['skipped'] == info['shards'] else 'ok'
+        print(f"  {name}: {status} ({info['shards']} shard(s), {info['failed']} failed, {info['duration']:.2f}s)")
+    slowest = sorted(results, key=lambda r: r['duration'], reverse=True)[:3]
+    if len(results) > 1:
+        print('Slowest shards:')
+        for r in slowest:
+            print(f"  {r['language']}#{r['shard']}: {r['duration']:.2f}s")
+    serial = sum(r['duration'] for r in results)
+    ideal = serial / len(results)
+    print(f"Test wall time: {wall:.2f}s (serial sum {serial:.2f}s, ideal {ideal:.2f}s)")
+    return {
+        'wall': wall,
+        'serial': serial,
+        'ideal': ideal,
+        'languages': by_lang,
+        'shards': results,
+        'slowest': slowest,
+        'passed': all(shard_passed(r) for r in results),
+    }
+
+
+def run_language_tests(cwd: Path, cfg: dict, lang: str, shards: int, timings: dict,
+                       selected: Optional[list[str]] = None) -> list[dict]:
+    """Гоняет все шарды одного языка параллельно и возвращает их результаты."""
+    planned = plan_language(cwd, cfg, lang, shards, timings, selected)
+    if not planned:
+        return []
+    with ThreadPoolExecutor(max_workers=len(planned)) as pool:
+        return list(pool.map(lambda item: _run_shard(cwd, lang, item[0], len(planned), item[1]),
+                             enumerate(planned)))
+
+
+def finish_tests(cwd: Path, timings: dict, results: list[dict], wall: float) -> dict:
+    """Сводный отчёт по всем шардам; обновляет базу длительностей и .automata/test-report.json."""
+    report = _report(results, wall)
+    save_timings(cwd, timings, results)
+    try:
+        write_json(cache_dir(cwd).parent / 'test-report.json', report)
+    except OSError:
+        pass
+    return report
+
 
+def select_tests(cwd: Path, cfg: dict, languages: list[str], changed_since: Optional[str]) -> dict:
+    if not changed_since:
+        return {}
+    selection = select_affected(cwd, cfg, languages, changed_since)
+    for lang in languages:
+        picked = selection.get(lang)
+        if picked is None:
+            print(f"{lang}: cannot map changes since {changed_since}, running full suite")
+        else:
+            print(f"{lang}: {len(picked)} affected test target(s) since {changed_since}")
+    return selection
 
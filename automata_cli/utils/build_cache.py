@@ -0,0 +1,128 @@
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from ..detectors import VCS_DIRS
+from .cache import cache_dir, read_json, write_json
+
+
+# Ограничение индекса по умолчанию (байты сериализованного JSON)
+DEFAULT_MAX_BYTES = 256 * 1024
+
+
+def _has_magic(pattern: str) -> bool:
+    return any(ch in pattern for ch in '*?[')
+
+
+def _file_digest(path: Path) -> Optional[str]:
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+class BuildCache:
+    """Кэш шагов сборки: шаг пропускается, если хэш его входов и состояние выходов не изменились.
+
+    Записи хранятся в .automata/cache/build/index.json и вытесняются по LRU,
+    когда индекс превышает max_bytes.
+    """
+
+    def __init__(self, cwd: Path, cfg: Optional[Dict] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cwd = cwd
+        self.cfg = cfg or {}
+        self.max_bytes = max_bytes
+        self.path = cache_dir(cwd) / 'build' / 'index.json'
+        self.entries: Dict[str, dict] = (read_json(self.path) or {}).get('entries', {})
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def _walk(self, top: str, exclude: set) -> Iterator[str]:
+        """Все файлы под top, кроме VCS_DIRS и путей из exclude.
+
+        Список пропусков детектора (build, out, dist, target, ...) тут не действует:
+        исходники вроде internal/build/*.go — такие же входы шага, как и остальные.
+        """
+        for dirpath, dirnames, filenames in os.walk(self.cwd / top):
+            rel_dir = os.path.relpath(dirpath, self.cwd).replace(os.sep, '/')
+            prefix = '' if rel_dir == '.' else rel_dir + '/'
+            dirnames[:] = [d for d in dirnames if d not in VCS_DIRS and prefix + d not in exclude]
+            for name in filenames:
+                if prefix + name not in exclude:
+                    yield prefix + name
+
+    def _resolve(self, patterns: Iterable[str], outputs: Iterable[str] = ()) -> List[str]:
+        exclude = {o.strip('/') for o in outputs}
+        plain = []
+        globs = []
+        for p in patterns:
+            (globs if _has_magic(p) else plain).append(p.strip('/'))
+        files = [p for p in plain if (self.cwd / p).is_file()]
+        dirs = [p for p in plain if (self.cwd / p).is_dir()]
+        if globs:
+            # шаблон может совпасть где угодно — обходим проект целиком
+            for rel in self._walk('', exclude):
+                if any(fnmatch.fnmatchcase(rel, g) for g in globs) or any(rel.startswith(d + '/') for d in dirs):
+                    files.append(rel)
+        else:
+            for d in dirs:
+                files.extend(self._walk(d, exclude))
+        return sorted(set(files))
+
+    def input_hash(self, step: str, inputs: Iterable[str], extra: str = '', outputs: Iterable[str] = ()) -> str:
+        """Хэш входов шага; его собственные выходы в хэш не попадают, даже если лежат среди входов."""
+        h = hashlib.sha256(f'{step}\0{extra}\0'.encode())
+        for rel in self._resolve(inputs, outputs):
+            h.update(f'{rel}\0{_file_digest(self.cwd / rel)}\0'.encode())
+        return h.hexdigest()
+
+    def _outputs_state(self, outputs: Iterable[str]) -> Optional[list]:
+        state = []
+        for rel in outputs:
+            try:
+                st = os.stat(self.cwd / rel)
+            except OSError:
+                return None
+            state.append([rel, st.st_mtime_ns])
+        return state
+
+    def is_fresh(self, step: str, digest: str, outputs: Iterable[str]) -> bool:
+        key = f'{step}:{digest}'
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry or entry.get('outputs') != self._outputs_state(outputs):
+                return False
+            entry['last_used'] = time.time()
+            self._dirty = True
+            return True
+
+    def record(self, step: str, digest: str, outputs: Iterable[str]) -> None:
+        state = self._outputs_state(outputs)
+        if state is None:
+            return
+        with self._lock:
+            self.entries[f'{step}:{digest}'] = {'outputs': state, 'last_used': time.time()}
+            self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            # LRU: выбрасываем самые давно использованные записи, пока индекс не влезет в лимит
+            order = sorted(self.entries, key=lambda k: self.entries[k].get('last_used', 0))
+            size = len(json.dumps({'entries': self.entries}))
+            while order and size > self.max_bytes:
+                key = order.pop(0)
+                size -= len(json.dumps({key: self.entries.pop(key)})) - 2
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_json(self.path, {'entries': self.entries})
+            self._dirty = False
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Any, List, Optional
+
+
+CACHE_DIR = Path('.automata') / 'cache'
+
+
+def cache_dir(cwd: Path) -> Path:
+    """Каталог кэша внутри проекта; сам .automata скрыт от git через свой .gitignore."""
+    path = cwd / CACHE_DIR
+    if not path.exists():
+        path.mkdir(parents=True, exist_ok=True)
+        gitignore = path.parent / '.gitignore'
+        if not gitignore.exists():
+            gitignore.write_text('*\n', encoding='utf-8')
+    return path
+
+
+def read_json(path: Path) -> Optional[Any]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: Path, data: Any) -> None:
+    """Атомарная запись: параллельный читатель не увидит полузаписанный файл."""
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def git_output(args: List[str], cwd: Path) -> Optional[str]:
+    try:
+        result = subprocess.run(['git'] + args, cwd=str(cwd), capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+
+class Tracer:
+    """Собирает события конвейера в формате Chrome Trace (chrome://tracing, ui.perfetto.dev)."""
+
+    def __init__(self):
+        self.events: list = []
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._wall0 = time.time()
+        self._tids: Dict[int, int] = {}
+
+    def _tid(self) -> int:
+        ident = threading.get_ident()
+        with self._lock:
+            if ident not in self._tids:
+                tid = len(self._tids) + 1
+                self._tids[ident] = tid
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                                    'args': {'name': threading.current_thread().name}})
+            return self._tids[ident]
+
+    def now(self) -> float:
+        return time.perf_counter()
+
+    def add(self, name: str, cat: str, start: float, end: float, args: Optional[dict] = None) -> None:
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': round((start - self._t0) * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': 1,
+            'tid': self._tid(),
+            'args': args or {},
+        }
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args) -> Iterator[dict]:
+        """Отрезок времени; в args можно дописывать результаты до выхода из блока."""
+        start = self.now()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = repr(e)
+            raise
+        finally:
+            self.add(name, cat, start, self.now(), args)
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = {
+                'traceEvents': list(self.events),
+                'displayTimeUnit': 'ms',
+                'otherData': {'started_at': self._wall0},
+            }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+
+_current = Tracer()
+
+
+def current() -> Tracer:
+    return _current
+
+
+def start() -> Tracer:
+    """Начинает новую трассу (вызывается в начале каждого запуска конвейера)."""
+    global _current
+    _current = Tracer()
+    return _current
+
+
+def traced_process(cmd: list, cat: str, proc_start: float, code: int,
+                   cpu: Optional[float], rss: Optional[int], **args) -> None:
+    """Записывает завершившийся дочерний процесс в текущую трассу."""
+    args.update(command=' '.join(cmd), exit_code=code)
+    if cpu is not None:
+        args['cpu_s'] = round(cpu, 4)
+    if rss is not None:
+        args['peak_rss_kb'] = rss
+    name = ' '.join([os.path.basename(cmd[0])] + list(cmd[1:2])) if cmd else 'process'
+    _current.add(name, cat, proc_start, _current.now(), args)
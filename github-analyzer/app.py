@@ -1,23 +1,37 @@
 import os
+import sys
 import json
+import asyncio
 import subprocess
-import tempfile
-import shutil
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncGenerator, List, Optional
 import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
-import ollama
 from dotenv import load_dotenv
-from deploy_service import DeployService
+
+# automata_cli lives in the parent project; detection runs in-process instead of spawning the CLI
+AUTOMATA_PATH = Path(__file__).parent.parent
+if str(AUTOMATA_PATH) not in sys.path:
+    sys.path.insert(0, str(AUTOMATA_PATH))
+
+from automata_cli import detect as automata_detect, detect_paths, is_detection_input
+from deploy_service import DEPLOY_MAX_PARALLEL, DeployService, rollout_params
+from github_client import github_client
+from job_queue import Job, JobQueue, QueueFullError
+from llm_providers import LLMClient, TokenCallback
+from ssh_pool import ssh_pool
+from repo_cache import BranchNotFoundError, RepoMirrorCache, mirror_cache, partial_mirror_cache
+from result_cache import CachedAnalysis, TokenFeed
 
 load_dotenv()
 
-app = FastAPI(title="GitHub Analyzer", version="1.0.0")
+# Part of the /analyze cache key: bump when detection or analysis output changes
+ANALYZER_VERSION = "1.1.0"
+
+app = FastAPI(title="GitHub Analyzer", version=ANALYZER_VERSION)
 
 # CORS middleware
 app.add_middleware(
@@ -31,17 +45,63 @@ app.add_middleware(
 # Mount static files
 app.mount("/static", StaticFiles(directory="front"), name="static")
 
-# Initialize LLM clients
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY")) if os.getenv("OPENAI_API_KEY") else None
-ollama_available = True  # Ollama runs locally
+# "sparse": blobless clone, only manifest files are checked out; "full": complete working tree
+ANALYZE_CLONE_MODE = os.getenv("ANALYZE_CLONE_MODE", "sparse")
+
+# Initialize LLM clients (OpenAI if OPENAI_API_KEY is set, then local Ollama)
+llm_client = LLMClient.from_env()
 
 class GitHubAnalyzer:
     def __init__(self):
-        self.automata_path = Path(__file__).parent.parent  # Path to main automata project
+        self.automata_path = AUTOMATA_PATH  # Path to main automata project
+        self.results = CachedAnalysis(ANALYZER_VERSION)
+        # LLM tokens of running analyses, keyed by repository, for /analyze/stream
+        self.tokens = TokenFeed()
+        self.repos = partial_mirror_cache if ANALYZE_CLONE_MODE == "sparse" else mirror_cache
         print(f"Automata path: {self.automata_path}")
     
     async def analyze_repository(self, github_url: str) -> Dict[str, Any]:
-        """Analyze GitHub repository using Amazing Automata and Mistral AI"""
+        """Analyze GitHub repository; repeated and concurrent requests for the same commit share one result"""
+        feed_key = RepoMirrorCache.key(github_url)
+        
+        def on_token(provider: str, text: str) -> None:
+            self.tokens.publish(feed_key, {"type": "token", "provider": provider, "text": text})
+        
+        async def analyze(sha: Optional[str]) -> Dict[str, Any]:
+            try:
+                return await self._analyze(github_url, on_token, commit=sha)
+            finally:
+                self.tokens.finish(feed_key)
+        
+        return await self.results.run(github_url, analyze)
+    
+    async def analyze_repository_stream(self, github_url: str, job: Job) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yields LLM tokens of the queued analysis of github_url as they arrive, then the job's result"""
+        feed_key = RepoMirrorCache.key(github_url)
+        events = self.tokens.subscribe(feed_key)
+        finished = asyncio.ensure_future(job.done.wait())
+        try:
+            while True:
+                event = asyncio.ensure_future(events.get())
+                await asyncio.wait({event, finished}, return_when=asyncio.FIRST_COMPLETED)
+                if not event.done():
+                    event.cancel()
+                    break
+                yield event.result()
+            while not events.empty():
+                yield events.get_nowait()
+        finally:
+            # the shared job keeps running for the other requests if this client goes away
+            finished.cancel()
+            self.tokens.unsubscribe(feed_key, events)
+        if job.status == "failed":
+            yield {"type": "error", "status_code": job.status_code, "message": job.error}
+        else:
+            yield {"type": "result", **job.result}
+    
+    async def _analyze(self, github_url: str, on_token: Optional[TokenCallback] = None,
+                       commit: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze GitHub repository using Amazing Automata and Mistral AI (at `commit` if given)"""
         temp_dir = None
         try:
             # Check if repository is public
@@ -54,16 +114,17 @@ class GitHubAnalyzer:
                 }
             
             # Clone repository
-            temp_dir = await self._clone_repository(github_url)
+            temp_dir, files = await self._clone_repository(github_url, commit)
             
             # Run Amazing Automata detection
-            detected_info = self._run_automata_detect(temp_dir)
+            detected_info = await self._run_automata_detect(temp_dir, files)
             
             # Get AI analysis
             ai_analysis = await self._get_llm_analysis(
                 repo_info=repo_info,
                 detected_info=detected_info,
-                repo_path=temp_dir
+                repo_path=temp_dir,
+                on_token=on_token
             )
             
             return {
@@ -71,7 +132,9 @@ class GitHubAnalyzer:
                 "message": "Анализ завершен успешно",
                 "repo_info": repo_info,
                 "detected_info": detected_info,
-                "ai_analysis": ai_analysis
+                "ai_analysis": ai_analysis,
+                # no LLM answer: the heuristic fallback is cached only briefly
+                "degraded": isinstance(ai_analysis, dict) and ai_analysis.get("ai_provider") == "fallback"
             }
             
         except Exception as e:
@@ -81,17 +144,11 @@ class GitHubAnalyzer:
                 "repo_info": {}
             }
         finally:
-            if temp_dir and temp_dir.exists():
-                try:
-                    shutil.rmtree(temp_dir)
-                except PermissionError:
+            if temp_dir:
+                await self.repos.release(temp_dir)
+                if temp_dir.exists():
                     # On Windows, git files might be locked
-                    import time
-                    time.sleep(0.1)
-                    try:
-                        shutil.rmtree(temp_dir)
-                    except PermissionError:
-                        print(f"Warning: Could not delete temp directory {temp_dir}")
+                    print(f"Warning: Could not delete temp directory {temp_dir}")
     
     async def _check_repository_visibility(self, github_url: str) -> tuple[bool, Dict[str, Any]]:
         """Check if GitHub repository is public"""
@@ -103,97 +160,60 @@ class GitHubAnalyzer:
             
             owner, repo = parts[0], parts[1].replace(".git", "")
             
-            # Check via GitHub API
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"https://api.github.com/repos/{owner}/{repo}")
-                
-                if response.status_code == 404:
-                    raise HTTPException(status_code=404, detail="Репозиторий не найден")
-                
-                if response.status_code == 403:
-                    # Rate limited or private
-                    return False, {"message": "Репозиторий недоступен (возможно приватный)"}
-                
-                repo_data = response.json()
-                return not repo_data.get("private", True), repo_data
+            # Check via GitHub API (shared pooled client, answered from its ETag cache when unchanged)
+            status, repo_data = await github_client.get_repo(owner, repo)
+            
+            if status == 404:
+                raise HTTPException(status_code=404, detail="Репозиторий не найден")
+            
+            if status == 403:
+                # Rate limited or private
+                return False, {"message": "Репозиторий недоступен (возможно приватный)"}
+            
+            repo_data = repo_data or {}
+            return not repo_data.get("private", True), repo_data
                 
         except httpx.HTTPError:
             return False, {"message": "Ошибка при проверке репозитория"}
     
-    async def _clone_repository(self, github_url: str) -> Path:
-        """Clone repository to temporary directory"""
-        temp_dir = Path(tempfile.mkdtemp())
+    async def _clone_repository(self, github_url: str, commit: Optional[str] = None) -> tuple[Path, Optional[List[str]]]:
+        """Check out repository from the shared mirror cache (fetches instead of re-cloning).
+        
+        `commit` pins the checkout to the SHA the result is cached under; the mirror is
+        fetched if it does not have it yet. In sparse mode only the files detection reads
+        are written to disk; the second item is then the full file list of the commit,
+        otherwise None.
+        """
         try:
-            # Simple git clone (requires git to be installed)
-            result = subprocess.run(
-                ["git", "clone", "--depth", "1", github_url, str(temp_dir)],
-                capture_output=True,
-                text=True,
-                check=True,
-                timeout=60  # 60 second timeout
-            )
-            return temp_dir
+            if self.repos.partial:
+                return await self.repos.sparse_checkout(github_url, is_detection_input, commit=commit)
+            return await self.repos.checkout(github_url, commit=commit), None
         except subprocess.CalledProcessError as e:
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
             if "git" in e.stderr.lower() and "not found" in e.stderr.lower():
                 raise HTTPException(status_code=400, detail="Git не установлен. Установите Git для клонирования репозиториев.")
             raise HTTPException(status_code=400, detail=f"Не удалось клонировать репозиторий: {e.stderr}")
         except subprocess.TimeoutExpired:
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
             raise HTTPException(status_code=400, detail="Таймаут при клонировании репозитория")
         except FileNotFoundError:
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
             raise HTTPException(status_code=400, detail="Git не найден. Установите Git для клонирования репозиториев.")
+        except BranchNotFoundError as e:
+            raise HTTPException(status_code=400, detail=f"Не удалось клонировать репозиторий: {e}")
     
-    def _run_automata_detect(self, repo_path: Path) -> Dict[str, Any]:
-        """Run Amazing Automata detection on the repository"""
+    async def _run_automata_detect(self, repo_path: Path, files: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Run Amazing Automata detection on the repository (in-process, on a worker thread)"""
         try:
-            # Set up environment
-            env = os.environ.copy()
-            env['PYTHONPATH'] = str(self.automata_path) + os.pathsep + env.get('PYTHONPATH', '')
-            
-            # Run automata detect
-            cmd = [
-                "python", "-m", "automata_cli.cli", "run", 
-                "--cwd", str(repo_path), "--stage", "detect"
-            ]
-            
-            print(f"Running command: {' '.join(cmd)}")
-            print(f"Working directory: {self.automata_path}")
-            print(f"Repository path: {repo_path}")
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True,
-                env=env,
-                cwd=self.automata_path
-            )
-            
-            print(f"Automata stdout: {result.stdout}")
-            print(f"Automata stderr: {result.stderr}")
-            
-            return json.loads(result.stdout)
-            
-        except subprocess.CalledProcessError as e:
-            print(f"Automata error: {e.stderr}")
-            raise HTTPException(status_code=500, detail=f"Ошибка детекции: {e.stderr}")
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            raise HTTPException(status_code=500, detail="Ошибка парсинга результата детекции")
+            if files is not None:
+                result = await asyncio.to_thread(detect_paths, files, repo_path)
+            else:
+                result = await asyncio.to_thread(automata_detect, repo_path)
+        except Exception as e:
+            print(f"Automata error: {e}")
+            raise HTTPException(status_code=500, detail=f"Ошибка детекции: {e}")
+        return result.to_dict()
     
-    async def _get_llm_analysis(self, repo_info: Dict[str, Any], detected_info: Dict[str, Any], repo_path: Path) -> Dict[str, Any]:
-        """Get AI analysis using available LLM"""
+    async def _get_llm_analysis(self, repo_info: Dict[str, Any], detected_info: Dict[str, Any], repo_path: Path,
+                                on_token: Optional[TokenCallback] = None) -> Dict[str, Any]:
+        """Get AI analysis using available LLM; on_token(provider, text) receives the answer as it streams"""
         try:
             # Prepare context
             context = {
@@ -249,34 +269,11 @@ class GitHubAnalyzer:
             - priority_actions: приоритетные действия для улучшения
             """
             
-            # Try different LLM providers in order of preference
-            ai_response = None
-            
-            # 1. Try OpenAI
-            if openai_client:
-                try:
-                    response = openai_client.chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=2000,
-                        temperature=0.7
-                    )
-                    ai_response = response.choices[0].message.content.strip()
-                except Exception as e:
-                    print(f"OpenAI error: {e}")
-            
-            # 2. Try Ollama (local)
-            if not ai_response and ollama_available:
-                try:
-                    response = ollama.chat(
-                        model="llama3.2",  # or any other model you have
-                        messages=[{"role": "user", "content": prompt}]
-                    )
-                    ai_response = response['message']['content'].strip()
-                except Exception as e:
-                    print(f"Ollama error: {e}")
+            # Try different LLM providers in order of preference (async, with per-provider timeouts)
+            answer = await llm_client.complete(prompt, on_token)
+            ai_response = answer[1] if answer else None
             
-            # 3. Fallback to basic analysis
+            # Fallback to basic analysis
             if not ai_response:
                 return self._get_fallback_analysis(context)
             
@@ -350,12 +347,24 @@ class GitHubAnalyzer:
             "files_to_add": files_to_add,
             "deployment_plan": deployment_plan,
             "tech_stack_analysis": f"Обнаружены технологии: {', '.join(context['detected_languages'])}",
-            "priority_actions": ["Добавить Dockerfile", "Настроить CI/CD"]
+            "priority_actions": ["Добавить Dockerfile", "Настроить CI/CD"],
+            "ai_provider": "fallback"
         }
 
 # Initialize services
 analyzer = GitHubAnalyzer()
 deploy_service = DeployService(analyzer.automata_path)
+analysis_jobs = JobQueue(analyzer.analyze_repository)
+
+def _submit_analysis(github_url: str):
+    try:
+        return analysis_jobs.submit(github_url)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Сервис перегружен, повторите запрос позже",
+            headers={"Retry-After": str(e.retry_after)},
+        )
 
 @app.get("/")
 async def root():
@@ -372,8 +381,45 @@ async def analyze_repo(request: Dict[str, str]):
     if not github_url:
         raise HTTPException(status_code=400, detail="GitHub URL is required")
     
-    result = await analyzer.analyze_repository(github_url)
-    return result
+    job = _submit_analysis(github_url)
+    await job.done.wait()
+    if job.status == "failed":
+        raise HTTPException(status_code=job.status_code, detail=job.error)
+    return job.result
+
+@app.post("/jobs/analyze", status_code=202)
+async def submit_analysis(request: Dict[str, str]):
+    """Queue a repository analysis; poll GET /jobs/{job_id} for the result"""
+    github_url = request.get("github_url")
+    if not github_url:
+        raise HTTPException(status_code=400, detail="GitHub URL is required")
+    
+    job = _submit_analysis(github_url)
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a queued analysis, with the result once it is done"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job.to_dict()
+
+@app.post("/analyze/stream")
+async def analyze_repo_stream(request: Dict[str, str]):
+    """Analyze GitHub repository, streaming LLM tokens as server-sent events"""
+    github_url = request.get("github_url")
+    if not github_url:
+        raise HTTPException(status_code=400, detail="GitHub URL is required")
+    
+    # queued like /analyze: 429 when full, coalesced with other requests for the same commit
+    job = _submit_analysis(github_url)
+    
+    async def generate():
+        async for event in analyzer.analyze_repository_stream(github_url, job):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
 
 @app.post("/test-server")
 async def test_server(server_config: dict):
@@ -386,19 +432,34 @@ async def test_server(server_config: dict):
 
 @app.post("/deploy")
 async def deploy_repository(request: dict):
-    """Deploy repository to server"""
+    """Deploy repository to one server, or to several ("servers") in rolling batches"""
     try:
         server_config = request.get("server", {})
+        servers = request.get("servers") or []
         repository = request.get("repository", {})
+        rollout = request.get("rollout") or {}
         
-        if not server_config or not repository:
+        if not (server_config or servers) or not repository:
             raise HTTPException(status_code=400, detail="Server config and repository info are required")
         
+        if servers:
+            # reject a bad rollout now: once the stream is open the client can only get a log line
+            try:
+                batch, max_parallel = rollout_params(rollout.get("batch", "25%"),
+                                                     rollout.get("max_parallel", DEPLOY_MAX_PARALLEL))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            logs = deploy_service.deploy_fleet(servers, repository, batch=batch, max_parallel=max_parallel)
+        else:
+            logs = deploy_service.deploy_repository(server_config, repository)
+        
         async def generate():
-            async for log_line in deploy_service.deploy_repository(server_config, repository):
+            async for log_line in logs:
                 yield f"data: {json.dumps({'message': log_line})}\n\n"
         
         return StreamingResponse(generate(), media_type="text/plain")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -408,9 +469,26 @@ async def stop_deploy():
     deploy_service.stop_deployment()
     return {"status": "stopped"}
 
+@app.on_event("startup")
+async def start_analysis_workers():
+    analysis_jobs.start()
+
+@app.on_event("shutdown")
+async def close_github_client():
+    await analysis_jobs.stop()
+    await github_client.aclose()
+    ssh_pool.close_all()
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "jobs": analysis_jobs.stats(),
+        "cache": {
+            "analysis": analyzer.results.cache.stats(),
+            "llm": llm_client.cache.stats(),
+        },
+    }
 
 if __name__ == "__main__":
     import uvicorn
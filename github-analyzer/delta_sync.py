@@ -0,0 +1,227 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+from ssh_pool import SSHSession
+
+# Kept in the deployed directory: what the last sync wrote there
+MANIFEST_NAME = ".automata-manifest.json"
+# The same hashes in `sha256sum -c` format, so the server can check its files by itself
+CHECKSUMS_NAME = ".automata-manifest.sha256"
+# Both are extracted under these names and renamed only after the sync succeeded
+PENDING_MANIFEST_NAME = MANIFEST_NAME + ".new"
+PENDING_CHECKSUMS_NAME = CHECKSUMS_NAME + ".new"
+MANIFEST_VERSION = 1
+
+# Never deployed: VCS metadata and local caches
+EXCLUDE_DIRS = {".git", ".hg", ".svn", ".automata", "__pycache__"}
+# gzip level of the upload stream; 1 is several times faster than 9 and usually only slightly larger
+DEPLOY_GZIP_LEVEL = int(os.getenv("DEPLOY_GZIP_LEVEL", "1"))
+# Check the deployed files against their hashes on the server and re-send those changed there
+DEPLOY_VERIFY_REMOTE = os.getenv("DEPLOY_VERIFY_REMOTE", "1") != "0"
+
+Manifest = Dict[str, Dict[str, object]]
+
+
+class SyncStats(NamedTuple):
+    files: int
+    sent: int
+    deleted: int
+    bytes_sent: int
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_manifest(root: Path) -> Manifest:
+    """Relative path -> content hash, size and permission bits of every file under root.
+
+    Symlinks are recorded by their target and never followed.
+    """
+    manifest: Manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        names = filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+        dirnames[:] = [d for d in dirnames if d not in EXCLUDE_DIRS and not os.path.islink(os.path.join(dirpath, d))]
+        for name in names:
+            path = os.path.join(dirpath, name)
+            rel = name if rel_dir == "." else f"{rel_dir}/{name}".replace(os.sep, "/")
+            if rel in (MANIFEST_NAME, PENDING_MANIFEST_NAME, CHECKSUMS_NAME, PENDING_CHECKSUMS_NAME):
+                continue
+            st = os.lstat(path)
+            if os.path.islink(path):
+                manifest[rel] = {"sha": "link:" + os.readlink(path), "size": 0, "mode": 0}
+            else:
+                manifest[rel] = {"sha": _file_digest(path), "size": st.st_size, "mode": st.st_mode & 0o777}
+    return manifest
+
+
+def diff_manifests(local: Manifest, remote: Manifest) -> Tuple[List[str], List[str]]:
+    """(paths to send, paths to delete on the server before sending).
+
+    A directory of the last sync that is now a file is deleted as a whole, otherwise tar
+    could not replace it.
+    """
+    changed = [rel for rel, entry in local.items() if remote.get(rel) != entry]
+    remote_dirs = {rel.rsplit("/", i)[0] for rel in remote for i in range(1, rel.count("/") + 1)}
+    removed = [rel for rel in remote if rel not in local] + [rel for rel in changed if rel in remote_dirs]
+    return sorted(changed), sorted(removed)
+
+
+class _CountingWriter(io.RawIOBase):
+    """Write-only file object that forwards to `target` and counts the bytes."""
+
+    def __init__(self, target: BinaryIO):
+        self.target = target
+        self.count = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.target.write(data)
+        self.count += len(data)
+        return len(data)
+
+
+def _escape_name(rel: str) -> str:
+    """A path as sha256sum writes it: backslashes and newlines escaped."""
+    return rel.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def checksums(manifest: Manifest) -> bytes:
+    """The manifest's regular files as a `sha256sum -c` list."""
+    lines = []
+    for rel, entry in sorted(manifest.items()):
+        sha = str(entry["sha"])
+        if sha.startswith("link:"):
+            continue
+        if "\\" in rel or "\n" in rel:
+            lines.append(f"\\{sha}  {_escape_name(rel)}\n")
+        else:
+            lines.append(f"{sha}  {rel}\n")
+    return "".join(lines).encode()
+
+
+def write_delta(out: BinaryIO, root: Path, changed: List[str], manifest: Manifest,
+                level: int = DEPLOY_GZIP_LEVEL) -> int:
+    """Streams a gzip'ed tar of the changed files, the new manifest and its checksum list into out.
+
+    The last two go under their PENDING_* names.
+
+    Files are read and compressed as they are written, so nothing is staged on disk.
+    Returns the number of compressed bytes written.
+    """
+    counter = _CountingWriter(out)
+    with gzip.GzipFile(fileobj=counter, mode="wb", compresslevel=level, mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode="w|") as tar:
+            for rel in changed:
+                tar.add(root / rel, arcname=rel, recursive=False)
+            extras = {
+                PENDING_MANIFEST_NAME: json.dumps({"version": MANIFEST_VERSION, "files": manifest},
+                                                  sort_keys=True).encode(),
+                PENDING_CHECKSUMS_NAME: checksums(manifest),
+            }
+            for name, data in extras.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+    return counter.count
+
+
+async def read_remote_manifest(ssh: SSHSession, remote_path: str) -> Manifest:
+    result = await ssh.run(f"cat {remote_path}/{MANIFEST_NAME} 2>/dev/null")
+    try:
+        data = json.loads(result.stdout) if result.ok else {}
+    except ValueError:
+        return {}
+    return data.get("files", {}) if data.get("version") == MANIFEST_VERSION else {}
+
+
+def _null_list(paths: List[str]):
+    return lambda stdin: stdin.write(b"\0".join(rel.encode() for rel in paths))
+
+
+async def remote_mismatches(ssh: SSHSession, remote_path: str) -> Optional[List[str]]:
+    """Names of files on the server that no longer match CHECKSUMS_NAME (changed or missing).
+
+    sha256sum runs there with --quiet, so a clean tree sends nothing back. None if the
+    server has no checksum list (nothing deployed yet, or synced by an older version).
+    """
+    result = await ssh.run(f"cd {remote_path} 2>/dev/null && [ -f {CHECKSUMS_NAME} ] || exit 3; "
+                           f"sha256sum -c --quiet {CHECKSUMS_NAME} 2>/dev/null")
+    if result.exit_status == 3:
+        return None
+    names = []
+    for line in result.stdout.split("\n"):
+        for suffix in (": FAILED", ": FAILED open or read"):
+            if line.endswith(suffix):
+                names.append(line[:-len(suffix)])
+                break
+    return names
+
+
+async def sync_tree(ssh: SSHSession, root: Path, remote_path: str, local: Optional[Manifest] = None) -> SyncStats:
+    """Brings remote_path in line with the local tree, sending only files whose hash changed.
+
+    The server keeps the manifest of the last sync, so a redeploy after a small commit
+    uploads one small archive of the changed files, and files deleted locally are removed
+    there. Tracked files modified on the server since then (say, a package-lock.json
+    rewritten by `npm install`) are found by `sha256sum -c` there and sent again, unless
+    DEPLOY_VERIFY_REMOTE=0. Files the manifest does not know about (build output,
+    node_modules, ...) are left alone. Without a manifest (first deploy, or someone wiped
+    it) everything is sent. The manifest is replaced only after the files were, so a
+    failed sync is redone in full on the next attempt.
+    Pass `local` (build_manifest(root)) when syncing the same tree to several servers.
+    """
+    local, remote, mismatched = await asyncio.gather(
+        asyncio.to_thread(build_manifest, root) if local is None else asyncio.sleep(0, local),
+        read_remote_manifest(ssh, remote_path),
+        remote_mismatches(ssh, remote_path) if DEPLOY_VERIFY_REMOTE else asyncio.sleep(0, []),
+    )
+    if remote and mismatched:
+        # sha256sum may print a name with a newline or backslash escaped and prefixed with "\"
+        names = {"\\" + _escape_name(rel): rel for rel in remote if "\\" in rel or "\n" in rel}
+        names.update((rel, rel) for rel in remote)
+        drifted = {names[name] for name in mismatched if name in names}
+        # files that no longer match are treated as unknown to the server, so they are sent again
+        remote = {rel: entry for rel, entry in remote.items() if rel not in drifted}
+    changed, removed = diff_manifests(local, remote)
+    # without a checksum list on the server the sync still runs once to install it
+    if not changed and not removed and remote and mismatched is not None:
+        return SyncStats(len(local), 0, 0, 0)
+
+    if removed:
+        # before extracting: a file may be replaced by a directory of the same name or vice versa
+        await ssh.pipe(
+            f"mkdir -p {remote_path} && cd {remote_path} && xargs -0 rm -rf --",
+            _null_list(removed),
+            check=True,
+        )
+
+    sent = []
+
+    def produce(stdin: BinaryIO) -> None:
+        sent.append(write_delta(stdin, root, changed, local))
+
+    # packing, upload and extraction overlap: the archive goes straight into the remote tar's stdin
+    await ssh.pipe(
+        f"mkdir -p {remote_path} && cd {remote_path} && tar -xzf - && "
+        f"mv -f {PENDING_CHECKSUMS_NAME} {CHECKSUMS_NAME} && mv -f {PENDING_MANIFEST_NAME} {MANIFEST_NAME}",
+        produce,
+        check=True,
+    )
+    return SyncStats(len(local), len(changed), len(removed), sent[0] if sent else 0)
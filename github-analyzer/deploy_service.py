@@ -1,16 +1,65 @@
 import os
 import asyncio
+import math
 import subprocess
-import tempfile
-import shutil
-import json
-import re
 from pathlib import Path
-from typing import Dict, Any, AsyncGenerator
-import paramiko
-import threading
+from typing import Dict, Any, AsyncGenerator, List, Optional, Tuple, Union
+from automata_cli import detect as automata_detect
+from process_utils import run_command
+from repo_cache import mirror_cache
+from delta_sync import Manifest, SyncStats, build_manifest, sync_tree
+from ssh_pool import SSHSession, ssh_pool
+from log_stream import LogStream, LogWriter
 import time
 
+# Сколько серверов одной волны раскатки обновляются одновременно
+DEPLOY_MAX_PARALLEL = int(os.getenv("DEPLOY_MAX_PARALLEL", "8"))
+
+
+def host_label(server_config: Dict[str, Any]) -> str:
+    port = int(server_config.get('port', 22))
+    return server_config['ip'] if port == 22 else f"{server_config['ip']}:{port}"
+
+
+def rollout_params(batch: Any = '25%', max_parallel: Any = DEPLOY_MAX_PARALLEL) -> Tuple[Union[int, str], int]:
+    """Проверяет параметры раскатки до начала развертывания.
+    
+    batch: положительное число серверов или доля вида '25%' (больше 0, не больше 100).
+    Некорректные значения -> ValueError с понятным сообщением.
+    """
+    if isinstance(batch, str) and batch.strip().endswith('%'):
+        try:
+            percent = float(batch.strip()[:-1])
+        except ValueError:
+            percent = 0
+        if not 0 < percent <= 100:
+            raise ValueError(f"batch: ожидается доля от 0% до 100%, получено {batch!r}")
+        batch = batch.strip()
+    else:
+        try:
+            size = int(batch) if not isinstance(batch, (bool, float)) else 0
+        except (TypeError, ValueError):
+            size = 0
+        if size < 1:
+            raise ValueError(f"batch: ожидается положительное целое число или доля вида '25%', получено {batch!r}")
+        batch = size
+    try:
+        parallel = int(max_parallel) if not isinstance(max_parallel, (bool, float)) else 0
+    except (TypeError, ValueError):
+        parallel = 0
+    if parallel < 1:
+        raise ValueError(f"max_parallel: ожидается положительное целое число, получено {max_parallel!r}")
+    return batch, parallel
+
+
+def batch_size(total: int, batch: Union[int, str]) -> int:
+    """Размер волны: число серверов или доля вида '25%' (проверенные rollout_params)"""
+    if isinstance(batch, str):
+        size = math.ceil(total * float(batch[:-1]) / 100)
+    else:
+        size = batch
+    return min(max(size, 1), max(total, 1))
+
 
 class DeployService:
     def __init__(self, automata_path: Path):
@@ -20,24 +69,11 @@ class DeployService:
     async def test_server_connection(self, server_config: Dict[str, Any]) -> Dict[str, Any]:
         """Тестирует SSH подключение к серверу"""
         try:
-            # Создаем SSH клиент
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Подключаемся к серверу
-            ssh.connect(
-                hostname=server_config['ip'],
-                port=server_config['port'],
-                username=server_config['user'],
-                password=server_config['password'],
-                timeout=10
-            )
+            # Сессия из пула: после проверки деплой на тот же сервер не подключается заново
+            ssh = await ssh_pool.get(server_config, timeout=10)
             
             # Тестируем команду
-            stdin, stdout, stderr = ssh.exec_command('echo "SSH connection successful"')
-            result = stdout.read().decode().strip()
-            
-            ssh.close()
+            result = (await ssh.run('echo "SSH connection successful"')).stdout.strip()
             
             return {
                 'success': True,
@@ -52,60 +88,34 @@ class DeployService:
                 'message': f'Ошибка SSH подключения: {str(e)}'
             }
     
-    async def deploy_repository(self, server_config: Dict[str, Any], repo_info: Dict[str, Any]) -> AsyncGenerator[str, None]:
-        """Развертывает репозиторий на удаленном сервере"""
+    def _register(self, repo_info: Dict[str, Any]) -> str:
         deployment_id = f"{repo_info['name']}_{int(time.time())}"
         self.active_deployments[deployment_id] = {
             'status': 'running',
             'started_at': time.time()
         }
+        return deployment_id
+    
+    async def deploy_repository(self, server_config: Dict[str, Any], repo_info: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """Развертывает репозиторий на удаленном сервере"""
+        deployment_id = self._register(repo_info)
+        logs = LogStream()
+        release = None
         
         try:
             yield f"🚀 Начинаем развертывание {repo_info['name']} на сервере {server_config['ip']}"
             
-            # 1. Клонируем репозиторий локально для анализа
-            yield "📥 Клонируем репозиторий для анализа..."
-            temp_dir = await self._clone_repository(repo_info)
-            
-            # 2. Анализируем проект
-            yield "🔍 Анализируем технологический стек..."
-            detected_info = await self._analyze_project(temp_dir)
-            yield f"✅ Обнаружены технологии: {', '.join(detected_info.get('languages', []))}"
-            
-            # 3. Генерируем конфигурацию
-            yield "⚙️ Генерируем конфигурацию automata.yml..."
-            await self._generate_config(temp_dir, detected_info, repo_info['name'])
-            
-            # 4. Создаем архив для передачи
-            yield "📦 Создаем архив проекта..."
-            archive_path = await self._create_archive(temp_dir, repo_info['name'])
-            
-            # 5. Подключаемся к серверу
-            yield f"🔌 Подключаемся к серверу {server_config['ip']}..."
-            ssh = await self._connect_to_server(server_config)
-            
-            # 6. Передаем файлы на сервер
-            yield "📤 Передаем файлы на сервер..."
-            remote_path = f"{server_config['deployPath']}/{repo_info['name']}"
-            await self._upload_to_server(ssh, archive_path, remote_path)
-            
-            # 7. Устанавливаем зависимости на сервере
-            yield "🔧 Устанавливаем зависимости на сервере..."
-            await self._install_dependencies(ssh, remote_path, detected_info)
-            
-            # 8. Запускаем развертывание через Amazing Automata
-            yield "🚀 Запускаем автоматическое развертывание..."
-            await self._run_automata_deploy(ssh, remote_path, repo_info['name'])
-            
-            # 9. Проверяем статус приложения
-            yield "🔍 Проверяем статус развернутого приложения..."
-            app_status = await self._check_application_status(ssh, repo_info['name'])
+            # 1-3. Клон, анализ и конфигурация — локально
+            prepare = asyncio.ensure_future(self._prepare_release(repo_info, logs.writer()))
+            async for line in logs.follow(prepare):
+                yield line
+            release = prepare.result()
             
-            ssh.close()
-            
-            # Очистка
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            os.remove(archive_path)
+            # 4-8. Сервер: загрузка, зависимости, запуск, проверка
+            deploy = asyncio.ensure_future(self._deploy_to_host(server_config, repo_info, release, logs.writer()))
+            async for line in logs.follow(deploy):
+                yield line
+            app_status = deploy.result()
             
             yield "✅ Развертывание завершено успешно!"
             yield f"🌐 Приложение доступно по адресу: {app_status.get('url', 'http://server-ip:port')}"
@@ -116,21 +126,136 @@ class DeployService:
             yield f"❌ Ошибка развертывания: {str(e)}"
             self.active_deployments[deployment_id]['status'] = 'failed'
             raise
+        finally:
+            # Очистка
+            if release is not None:
+                await mirror_cache.release(release['path'])
     
-    async def _clone_repository(self, repo_info: Dict[str, Any]) -> Path:
-        """Клонирует репозиторий во временную директорию"""
-        temp_dir = Path(tempfile.mkdtemp())
+    async def deploy_fleet(self, servers: List[Dict[str, Any]], repo_info: Dict[str, Any],
+                           batch: Union[int, str] = '25%',
+                           max_parallel: int = DEPLOY_MAX_PARALLEL) -> AsyncGenerator[str, None]:
+        """Развертывает одну сборку на несколько серверов волнами (rolling).
+        
+        Репозиторий клонируется, анализируется и хэшируется один раз. Серверы волны
+        обновляются параллельно (не больше max_parallel одновременно), их логи идут
+        в общий поток с префиксом [host]. Следующая волна стартует, только если все
+        приложения текущей запущены; иначе раскатка останавливается.
+        """
+        batch, max_parallel = rollout_params(batch, max_parallel)
+        deployment_id = self._register(repo_info)
+        logs = LogStream()
+        release = None
+        size = batch_size(len(servers), batch)
+        results: Dict[int, Dict[str, Any]] = {}
+        slots = asyncio.Semaphore(max_parallel)
+        
+        async def deploy_host(index: int) -> None:
+            server_config = servers[index]
+            log = logs.writer(host_label(server_config))
+            async with slots:
+                try:
+                    results[index] = await self._deploy_to_host(server_config, repo_info, release, log)
+                except Exception as e:
+                    log(f"❌ Ошибка развертывания: {str(e)}")
+                    results[index] = {'status': 'failed', 'error': str(e)}
+                    return
+            log(f"✅ Готово, статус: {results[index].get('status')}")
         
+        try:
+            yield f"🚀 Начинаем развертывание {repo_info['name']} на {len(servers)} серверов, волнами по {size}"
+            
+            prepare = asyncio.ensure_future(self._prepare_release(repo_info, logs.writer()))
+            async for line in logs.follow(prepare):
+                yield line
+            release = prepare.result()
+            
+            halted = False
+            for number, start in enumerate(range(0, len(servers), size), 1):
+                if self.active_deployments[deployment_id]['status'] == 'stopped':
+                    yield "⏹ Развертывание остановлено, оставшиеся серверы пропущены"
+                    halted = True
+                    break
+                wave = range(start, min(start + size, len(servers)))
+                yield f"🌊 Волна {number}: {', '.join(host_label(servers[i]) for i in wave)}"
+                
+                async for line in logs.follow(asyncio.gather(*(deploy_host(i) for i in wave))):
+                    yield line
+                
+                unhealthy = [host_label(servers[i]) for i in wave if results[i].get('status') != 'running']
+                if unhealthy:
+                    yield f"⛔ Приложение не запущено на: {', '.join(unhealthy)}. Раскатка остановлена"
+                    halted = True
+                    break
+            
+            done = sum(1 for status in results.values() if status.get('status') == 'running')
+            yield f"📊 Итого: запущено на {done} из {len(servers)} серверов"
+            self.active_deployments[deployment_id]['status'] = 'failed' if halted else 'completed'
+            
+        except Exception as e:
+            yield f"❌ Ошибка развертывания: {str(e)}"
+            self.active_deployments[deployment_id]['status'] = 'failed'
+            raise
+        finally:
+            if release is not None:
+                await mirror_cache.release(release['path'])
+    
+    async def _prepare_release(self, repo_info: Dict[str, Any], log: LogWriter) -> Dict[str, Any]:
+        """Готовит сборку локально, один раз на развертывание: клон, анализ, automata.yml, манифест файлов"""
+        # 1. Клонируем репозиторий локально для анализа
+        log("📥 Клонируем репозиторий для анализа...")
+        temp_dir = await self._clone_repository(repo_info)
+        
+        try:
+            # 2. Анализируем проект
+            log("🔍 Анализируем технологический стек...")
+            detected_info = await self._analyze_project(temp_dir)
+            log(f"✅ Обнаружены технологии: {', '.join(detected_info.get('languages', []))}")
+            
+            # 3. Генерируем конфигурацию
+            log("⚙️ Генерируем конфигурацию automata.yml...")
+            await self._generate_config(temp_dir, detected_info, repo_info['name'])
+            
+            manifest = await asyncio.to_thread(build_manifest, temp_dir)
+        except BaseException:
+            await mirror_cache.release(temp_dir)
+            raise
+        
+        return {'path': temp_dir, 'detected_info': detected_info, 'manifest': manifest}
+    
+    async def _deploy_to_host(self, server_config: Dict[str, Any], repo_info: Dict[str, Any],
+                              release: Dict[str, Any], log: LogWriter) -> Dict[str, Any]:
+        """Развертывает подготовленную сборку на одном сервере; возвращает статус приложения"""
+        # 4. Подключаемся к серверу
+        log(f"🔌 Подключаемся к серверу {server_config['ip']}...")
+        ssh = await self._connect_to_server(server_config)
+        
+        # 5. Передаем на сервер только изменившиеся файлы
+        log("📤 Передаем изменения на сервер...")
+        remote_path = f"{server_config['deployPath']}/{repo_info['name']}"
+        stats = await self._upload_to_server(ssh, release['path'], remote_path, release['manifest'])
+        log(f"✅ Передано файлов: {stats.sent} из {stats.files}, удалено: {stats.deleted}, "
+            f"{stats.bytes_sent / 1024:.1f} КБ")
+        
+        # 6. Устанавливаем зависимости на сервере; вывод команд идет в лог построчно
+        log("🔧 Устанавливаем зависимости на сервере...")
+        await self._install_dependencies(ssh, remote_path, release['detected_info'], log)
+        
+        # 7. Запускаем развертывание через Amazing Automata
+        log("🚀 Запускаем автоматическое развертывание...")
+        await self._run_automata_deploy(ssh, remote_path, repo_info['name'], log)
+        
+        # 8. Проверяем статус приложения
+        log("🔍 Проверяем статус развернутого приложения...")
+        return await self._check_application_status(ssh, repo_info['name'])
+    
+    async def _clone_repository(self, repo_info: Dict[str, Any]) -> Path:
+        """Выдает рабочую копию репозитория из общего кэша зеркал (после анализа — без повторного клона)"""
         branch = repo_info.get('branch', 'main')
         clone_url = repo_info['url']
         
         try:
-            result = subprocess.run([
-                'git', 'clone', '--depth', '1', '--branch', branch, 
-                clone_url, str(temp_dir)
-            ], capture_output=True, text=True, check=True, timeout=60)
-            
-            return temp_dir
+            # fetch=True: деплой сразу после push должен получить новый коммит, а не зеркало из кэша
+            return await mirror_cache.checkout(clone_url, branch, fetch=True)
         except subprocess.CalledProcessError as e:
             raise Exception(f"Ошибка клонирования репозитория: {e.stderr}")
         except subprocess.TimeoutExpired:
@@ -139,15 +264,9 @@ class DeployService:
     async def _analyze_project(self, project_path: Path) -> Dict[str, Any]:
         """Анализирует проект для определения технологий"""
         try:
-            env = os.environ.copy()
-            env['PYTHONPATH'] = str(self.automata_path) + os.pathsep + env.get('PYTHONPATH', '')
-            
-            result = subprocess.run([
-                "python", "-m", "automata_cli.cli", "run", 
-                "--cwd", str(project_path), "--stage", "detect"
-            ], capture_output=True, text=True, check=True, env=env, cwd=self.automata_path)
-            
-            return json.loads(result.stdout)
+            # automata_cli импортирован в процессе (app.py добавляет его в sys.path)
+            result = await asyncio.to_thread(automata_detect, project_path)
+            return result.to_dict()
         except Exception as e:
             raise Exception(f"Ошибка анализа проекта: {str(e)}")
     
@@ -157,164 +276,99 @@ class DeployService:
             env = os.environ.copy()
             env['PYTHONPATH'] = str(self.automata_path) + os.pathsep + env.get('PYTHONPATH', '')
             
-            subprocess.run([
+            await run_command([
                 "python", "-m", "automata_cli.cli", "generate", 
                 "--cwd", str(project_path), "--force"
-            ], capture_output=True, text=True, check=True, env=env, cwd=self.automata_path)
+            ], check=True, env=env, cwd=self.automata_path)
             
         except Exception as e:
             raise Exception(f"Ошибка генерации конфигурации: {str(e)}")
     
-    async def _create_archive(self, project_path: Path, project_name: str) -> str:
-        """Создает архив проекта"""
-        archive_path = tempfile.mktemp(suffix='.tar.gz')
-        
+    async def _connect_to_server(self, server_config: Dict[str, Any]) -> SSHSession:
+        """Берет SSH сессию к серверу из пула (подключается, если ее еще нет)"""
         try:
-            subprocess.run([
-                'tar', '-czf', archive_path, '-C', str(project_path.parent), project_path.name
-            ], check=True, capture_output=True)
-            
-            return archive_path
-        except Exception as e:
-            raise Exception(f"Ошибка создания архива: {str(e)}")
-    
-    async def _connect_to_server(self, server_config: Dict[str, Any]) -> paramiko.SSHClient:
-        """Устанавливает SSH подключение к серверу"""
-        try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            ssh.connect(
-                hostname=server_config['ip'],
-                port=server_config['port'],
-                username=server_config['user'],
-                password=server_config['password'],
-                timeout=30
-            )
-            
-            return ssh
+            return await ssh_pool.get(server_config)
         except Exception as e:
             raise Exception(f"Ошибка подключения к серверу: {str(e)}")
     
-    async def _upload_to_server(self, ssh: paramiko.SSHClient, archive_path: str, remote_path: str):
-        """Загружает архив на сервер и распаковывает"""
+    async def _upload_to_server(self, ssh: SSHSession, project_path: Path, remote_path: str,
+                                manifest: Optional[Manifest] = None) -> SyncStats:
+        """Синхронизирует проект с сервером по манифесту: передает только измененные файлы, удаленные — удаляет"""
         try:
-            # Создаем SFTP соединение
-            sftp = ssh.open_sftp()
-            
-            # Создаем директорию на сервере
-            stdin, stdout, stderr = ssh.exec_command(f'mkdir -p {remote_path}')
-            stdout.channel.recv_exit_status()
-            
-            # Загружаем архив
-            remote_archive = f"{remote_path}/project.tar.gz"
-            sftp.put(archive_path, remote_archive)
-            
-            # Распаковываем архив
-            stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && tar -xzf project.tar.gz --strip-components=1')
-            stdout.channel.recv_exit_status()
-            
-            # Удаляем архив
-            stdin, stdout, stderr = ssh.exec_command(f'rm {remote_archive}')
-            stdout.channel.recv_exit_status()
-            
-            sftp.close()
-            
+            return await sync_tree(ssh, project_path, remote_path, manifest)
         except Exception as e:
             raise Exception(f"Ошибка загрузки файлов на сервер: {str(e)}")
     
-    async def _install_dependencies(self, ssh: paramiko.SSHClient, remote_path: str, detected_info: Dict[str, Any]):
+    async def _install_dependencies(self, ssh: SSHSession, remote_path: str, detected_info: Dict[str, Any],
+                                    log: Optional[LogWriter] = None):
         """Устанавливает зависимости на сервере"""
         try:
             languages = detected_info.get('languages', [])
             
-            # Устанавливаем Docker если его нет
-            stdin, stdout, stderr = ssh.exec_command('which docker || (curl -fsSL https://get.docker.com -o get-docker.sh && sh get-docker.sh)')
-            stdout.channel.recv_exit_status()
+            # Системные пакеты ставятся одним скриптом по очереди: apt-get не работает параллельно
+            system = ['which docker || (curl -fsSL https://get.docker.com -o get-docker.sh && sh get-docker.sh)']
+            project = []
             
-            # Устанавливаем Python зависимости
+            # Python зависимости
             if 'python' in languages:
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && python3 -m pip install --upgrade pip')
-                stdout.channel.recv_exit_status()
-                
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && pip3 install -r requirements.txt')
-                stdout.channel.recv_exit_status()
+                project.append(f'cd {remote_path} && {{ python3 -m pip install --upgrade pip; pip3 install -r requirements.txt; }}')
             
-            # Устанавливаем Node.js зависимости
+            # Node.js зависимости
             if 'node' in languages:
-                stdin, stdout, stderr = ssh.exec_command('which node || (curl -fsSL https://deb.nodesource.com/setup_18.x | sudo -E bash - && sudo apt-get install -y nodejs)')
-                stdout.channel.recv_exit_status()
-                
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && npm install')
-                stdout.channel.recv_exit_status()
+                system.append('which node || (curl -fsSL https://deb.nodesource.com/setup_18.x | sudo -E bash - && sudo apt-get install -y nodejs)')
+                project.append(f'cd {remote_path} && npm install')
             
-            # Устанавливаем Java зависимости
+            # Java зависимости
             if 'java' in languages:
-                stdin, stdout, stderr = ssh.exec_command('which java || sudo apt-get update && sudo apt-get install -y openjdk-17-jdk')
-                stdout.channel.recv_exit_status()
-                
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && chmod +x gradlew && ./gradlew build -x test')
-                stdout.channel.recv_exit_status()
+                system.append('(which java || sudo apt-get update && sudo apt-get install -y openjdk-17-jdk)')
+                project.append(f'cd {remote_path} && chmod +x gradlew && ./gradlew build -x test')
+            
+            await ssh.run('; '.join(system), on_line=log)
+            # Зависимости разных языков независимы — ставим их параллельно, каждую в своем канале
+            await ssh.run_many(project, on_line=log)
                 
         except Exception as e:
             raise Exception(f"Ошибка установки зависимостей: {str(e)}")
     
-    async def _run_automata_deploy(self, ssh: paramiko.SSHClient, remote_path: str, project_name: str):
+    async def _run_automata_deploy(self, ssh: SSHSession, remote_path: str, project_name: str,
+                                   log: Optional[LogWriter] = None):
         """Запускает развертывание через Amazing Automata на сервере"""
         try:
             # Копируем automata_cli на сервер
-            sftp = ssh.open_sftp()
-            
-            # Создаем директорию для automata_cli
-            stdin, stdout, stderr = ssh.exec_command(f'mkdir -p {remote_path}/automata_cli')
-            stdout.channel.recv_exit_status()
-            
-            # Копируем основные файлы automata_cli
-            automata_files = [
-                'automata_cli/__init__.py',
-                'automata_cli/cli.py',
-                'automata_cli/pipeline.py',
-                'automata_cli/detectors.py',
-                'automata_cli/utils/config.py',
-                'automata_cli/generators/config_generator.py',
-                'automata_cli/runners/builders.py',
-                'automata_cli/runners/tests.py',
-                'automata_cli/runners/deploy.py'
-            ]
-            
-            for file_path in automata_files:
-                if (self.automata_path / file_path).exists():
-                    remote_file = f"{remote_path}/{file_path}"
-                    sftp.put(str(self.automata_path / file_path), remote_file)
+            # Копируем пакет automata_cli целиком: модули импортируют друг друга
+            automata_files = sorted(
+                path.relative_to(self.automata_path).as_posix()
+                for path in (self.automata_path / 'automata_cli').rglob('*.py')
+            )
+            remote_dirs = sorted({f"{remote_path}/{file_path.rsplit('/', 1)[0]}" for file_path in automata_files})
+            await ssh.run('mkdir -p ' + ' '.join(remote_dirs))
             
-            sftp.close()
+            # Все файлы идут через один SFTP канал сессии
+            await ssh.put([
+                (str(self.automata_path / file_path), f"{remote_path}/{file_path}")
+                for file_path in automata_files
+            ])
             
             # Запускаем развертывание
-            stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && PYTHONPATH={remote_path} python3 -m automata_cli.cli run --cwd . --stage all')
-            
-            # Читаем вывод
-            while True:
-                line = stdout.readline()
-                if not line:
-                    break
-                # Здесь можно добавить логирование вывода
-            
-            stdout.channel.recv_exit_status()
+            await ssh.run(f'cd {remote_path} && PYTHONPATH={remote_path} python3 -m automata_cli.cli run --cwd . --stage all',
+                          on_line=log)
             
         except Exception as e:
             raise Exception(f"Ошибка запуска развертывания: {str(e)}")
     
-    async def _check_application_status(self, ssh: paramiko.SSHClient, project_name: str) -> Dict[str, Any]:
+    async def _check_application_status(self, ssh: SSHSession, project_name: str) -> Dict[str, Any]:
         """Проверяет статус развернутого приложения"""
         try:
-            # Проверяем запущенные Docker контейнеры
-            stdin, stdout, stderr = ssh.exec_command(f'docker ps --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}"')
-            container_info = stdout.read().decode().strip()
+            # Запущенные Docker контейнеры и порты запрашиваем одновременно
+            ps, port = await ssh.run_many([
+                f'docker ps --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}"',
+                f'docker port {project_name}-app',
+            ])
+            container_info = ps.stdout.strip()
             
             if container_info:
                 # Извлекаем порт из Docker контейнера
-                stdin, stdout, stderr = ssh.exec_command(f'docker port {project_name}-app')
-                port_info = stdout.read().decode().strip()
+                port_info = port.stdout.strip()
                 
                 return {
                     'status': 'running',
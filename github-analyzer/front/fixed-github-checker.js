@@ -46,8 +46,20 @@ document.addEventListener('DOMContentLoaded', function() {
         
         console.log('Starting analysis...');
         
+        // Ответ ИИ показываем по мере генерации, до готового результата
+        let streamedText = '';
+        function showToken(text) {
+            streamedText += text;
+            let output = repoInfo.querySelector('.ai-stream');
+            if (!output) {
+                repoInfo.innerHTML = '<p>🤖 ИИ анализирует репозиторий...</p><pre class="ai-stream" style="white-space: pre-wrap;"></pre>';
+                output = repoInfo.querySelector('.ai-stream');
+            }
+            output.textContent = streamedText;
+        }
+        
         try {
-            const repoData = await checkGitHubRepo(url);
+            const repoData = await checkGitHubRepo(url, showToken);
             console.log('Analysis complete:', repoData);
             
             // Сохраняем в историю
@@ -180,7 +192,61 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    async function checkGitHubRepo(url) {
+    async function checkGitHubRepo(url, onToken) {
+        console.log('Making API request to /analyze/stream');
+        const response = await fetch('/analyze/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ github_url: url })
+        });
+        
+        if (response.status === 404 || response.status === 405) {
+            // Сервер без потокового анализа (simple_app)
+            return await checkGitHubRepoOnce(url);
+        }
+        if (!response.ok) {
+            const error = await response.json();
+            console.error('API error:', error);
+            throw new Error(error.detail || 'Ошибка при запросе к API');
+        }
+        
+        // Server-sent events: токены ИИ ({type: 'token'}), затем итог ({type: 'result'} или {type: 'error'})
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+        
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            
+            for (const event of events) {
+                if (!event.startsWith('data: ')) continue;
+                const data = JSON.parse(event.slice(6));
+                if (data.type === 'token') {
+                    onToken(data.text);
+                } else if (data.type === 'result') {
+                    result = data;
+                } else if (data.type === 'error') {
+                    throw new Error(data.message || 'Ошибка при запросе к API');
+                }
+            }
+        }
+        
+        if (!result) {
+            throw new Error('Сервер не вернул результат анализа');
+        }
+        console.log('API response:', result);
+        return result;
+    }
+    
+    async function checkGitHubRepoOnce(url) {
         console.log('Making API request to /analyze');
         try {
             const response = await fetch('/analyze', {
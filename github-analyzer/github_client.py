@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+# Optional token: raises the rate limit from 60 to 5000 requests per hour
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN") or None
+
+# How many ETag'ed responses are kept for conditional requests
+ETAG_CACHE_ENTRIES = 1024
+# Longest rate-limit wait worth doing inside a request; beyond it the limited response is returned
+MAX_BACKOFF = float(os.getenv("GITHUB_MAX_BACKOFF", "30"))
+MAX_RETRIES = 3
+
+
+class GitHubClient:
+    """Shared GitHub REST client: pooled keep-alive connections and conditional requests.
+
+    Each 200 response with an ETag is remembered. The next request for the same path sends
+    If-None-Match, and a 304 reuses the stored body. Primary and secondary rate limits
+    (403/429 with X-RateLimit-* or Retry-After) and 5xx responses are retried with backoff
+    when the wait is at most MAX_BACKOFF.
+    """
+
+    def __init__(self, base_url: str = GITHUB_API_URL, token: Optional[str] = GITHUB_TOKEN,
+                 max_entries: int = ETAG_CACHE_ENTRIES, max_backoff: float = MAX_BACKOFF,
+                 max_retries: int = MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.max_entries = max_entries
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.rate_limit: Dict[str, Any] = {}
+        self._etags: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            headers = {
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+                "User-Agent": "github-analyzer",
+            }
+            if self.token:
+                headers["Authorization"] = f"Bearer {self.token}"
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        return self._client
+
+    def _note_rate_limit(self, response: httpx.Response) -> None:
+        remaining = response.headers.get("x-ratelimit-remaining")
+        reset = response.headers.get("x-ratelimit-reset")
+        if remaining is not None and reset is not None:
+            self.rate_limit = {"remaining": int(remaining), "reset": int(reset)}
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the response is final."""
+        status = response.status_code
+        if status in (403, 429):
+            retry_after = response.headers.get("retry-after")
+            if retry_after is not None:
+                return float(retry_after)
+            if response.headers.get("x-ratelimit-remaining") == "0":
+                return max(0.0, int(response.headers.get("x-ratelimit-reset", "0")) - time.time()) + 1
+            return None
+        if status >= 500:
+            return float(2 ** attempt)
+        return None
+
+    async def _wait_for_quota(self) -> None:
+        # the last response said the limit is used up: wait for the reset instead of burning a 403
+        if self.rate_limit.get("remaining") == 0:
+            delay = self.rate_limit["reset"] - time.time() + 1
+            if 0 < delay <= self.max_backoff:
+                await asyncio.sleep(delay)
+
+    async def get_json(self, path: str) -> Tuple[int, Any]:
+        """GET path relative to the API root; returns (status code, decoded JSON body or None)."""
+        cached = self._etags.get(path)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        await self._wait_for_quota()
+        for attempt in range(self.max_retries + 1):
+            response = await self._http().get(path, headers=headers)
+            self._note_rate_limit(response)
+            delay = self._retry_delay(response, attempt)
+            if delay is None or delay > self.max_backoff or attempt == self.max_retries:
+                break
+            await asyncio.sleep(delay)
+
+        if response.status_code == 304 and cached:
+            self._etags.move_to_end(path)
+            return 200, cached[1]
+        try:
+            data = response.json() if response.content else None
+        except ValueError:
+            data = None
+        etag = response.headers.get("etag")
+        if response.status_code == 200 and etag:
+            self._etags[path] = (etag, data)
+            self._etags.move_to_end(path)
+            while len(self._etags) > self.max_entries:
+                self._etags.popitem(last=False)
+        return response.status_code, data
+
+    async def get_repo(self, owner: str, repo: str) -> Tuple[int, Any]:
+        return await self.get_json(f"/repos/{owner}/{repo}")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+github_client = GitHubClient()
@@ -0,0 +1,140 @@
+import asyncio
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Analyses running at once; the rest wait in a queue of at most ANALYZER_QUEUE_SIZE jobs
+JOB_WORKERS = int(os.getenv("ANALYZER_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("ANALYZER_QUEUE_SIZE", "32"))
+# How long a finished job's result stays available at GET /jobs/{id}
+JOB_RESULT_TTL = float(os.getenv("ANALYZER_JOB_TTL", "3600"))
+
+# Assumed job duration until the first jobs have finished
+DEFAULT_JOB_SECONDS = 30.0
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    """One queued call of the handler; `done` is set once it has a result or an error."""
+
+    def __init__(self, payload: Any):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """Bounded FIFO of jobs processed by a fixed pool of worker tasks.
+
+    submit() never waits: when max_size jobs are already queued it raises QueueFullError
+    with an estimate of when a slot frees up, so the caller can answer 429 + Retry-After.
+    Finished jobs are kept for result_ttl seconds.
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[Any]], workers: int = JOB_WORKERS,
+                 max_size: int = JOB_QUEUE_SIZE, result_ttl: float = JOB_RESULT_TTL):
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.result_ttl = result_ttl
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._avg_seconds = DEFAULT_JOB_SECONDS
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(self.max_size)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, payload: Any) -> Job:
+        if self._queue is None:
+            self.start()
+        self._expire()
+        job = Job(payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(self.retry_after())
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely free: some worker finishes its current job."""
+        return max(1, math.ceil(self._avg_seconds / max(1, self.workers)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": sum(1 for job in self.jobs.values() if job.status == "running"),
+            "max_queue": self.max_size,
+            "avg_job_seconds": round(self._avg_seconds, 1),
+        }
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await self.handler(job.payload)
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status, job.error, job.status_code = "failed", "Service is shutting down", 503
+                raise
+            except Exception as e:
+                # HTTPException from the handler keeps its status and message
+                job.status = "failed"
+                job.error = str(getattr(e, "detail", e))
+                job.status_code = getattr(e, "status_code", 500)
+            finally:
+                job.finished_at = time.time()
+                # moving average, so Retry-After follows the current load
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (job.finished_at - job.started_at)
+                job.done.set()
+                self._queue.task_done()
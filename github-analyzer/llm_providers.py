@@ -0,0 +1,168 @@
+import abc
+import asyncio
+import inspect
+import os
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Union
+
+from result_cache import TTLCache, cache_key
+
+# Maximum number of LLM completions running at once; other requests queue for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+
+# Completed answers keyed by (provider, model, prompt); LLM_CACHE_DIR unset means memory only
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "16")) * 1024 * 1024
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR") or None
+LLM_CACHE_DISK_MAX_BYTES = int(os.getenv("LLM_CACHE_DISK_MAX_MB", "128")) * 1024 * 1024
+
+TokenCallback = Callable[[str, str], Union[None, Awaitable[None]]]
+
+
+class LLMProvider(abc.ABC):
+    """One chat model behind an async token stream; timeout bounds the whole completion."""
+
+    name = "llm"
+
+    def __init__(self, model: str, timeout: float):
+        self.model = model
+        self.timeout = timeout
+
+    @abc.abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yields the answer to prompt as text chunks."""
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str = OPENAI_MODEL, timeout: float = OPENAI_TIMEOUT,
+                 max_tokens: int = 2000, temperature: float = 0.7):
+        super().__init__(model, timeout)
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=api_key, timeout=timeout, max_retries=1)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True,
+        )
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await response.close()
+
+
+class OllamaProvider(LLMProvider):
+    name = "ollama"
+
+    def __init__(self, model: str = OLLAMA_MODEL, timeout: float = OLLAMA_TIMEOUT, host: Optional[str] = None):
+        super().__init__(model, timeout)
+        import ollama
+        self.client = ollama.AsyncClient(host=host, timeout=timeout)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        parts = await self.client.chat(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        )
+        async for part in parts:
+            text = (part.get("message") or {}).get("content")
+            if text:
+                yield text
+
+
+async def _with_deadline(provider: LLMProvider, prompt: str) -> AsyncIterator[str]:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + provider.timeout
+    tokens = provider.stream(prompt)
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"no complete answer within {provider.timeout}s")
+            try:
+                yield await asyncio.wait_for(tokens.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+    finally:
+        await tokens.aclose()
+
+
+async def _notify(on_token: Optional[TokenCallback], provider: LLMProvider, text: str) -> None:
+    if on_token is not None:
+        ret = on_token(provider.name, text)
+        if inspect.isawaitable(ret):
+            await ret
+
+
+def prompt_key(provider: LLMProvider, prompt: str) -> str:
+    """Cache key of a completion; indentation and line breaks in the prompt do not matter."""
+    return cache_key("llm", provider.name, provider.model, " ".join(prompt.split()))
+
+
+class LLMClient:
+    """Tries providers in order; each call holds one of LLM_MAX_CONCURRENCY slots.
+
+    If a provider fails or times out before producing any tokens, the next one is tried.
+    After tokens have already been streamed to the caller, switching models would mix two
+    answers, so the call gives up instead.
+
+    Complete answers are cached per (provider, model, prompt). The cache is checked for
+    every provider, in order, before any provider is called or a slot is taken.
+    """
+
+    def __init__(self, providers: List[LLMProvider], max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 cache: Optional[TTLCache] = None):
+        self.providers = providers
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.cache = cache or TTLCache(LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES,
+                                       LLM_CACHE_DIR, LLM_CACHE_DISK_MAX_BYTES)
+
+    @classmethod
+    def from_env(cls) -> "LLMClient":
+        providers: List[LLMProvider] = []
+        if os.getenv("OPENAI_API_KEY"):
+            providers.append(OpenAIProvider(os.getenv("OPENAI_API_KEY")))
+        if os.getenv("OLLAMA_ENABLED", "1") != "0":
+            # Ollama runs locally
+            providers.append(OllamaProvider(host=os.getenv("OLLAMA_HOST") or None))
+        return cls(providers)
+
+    async def complete(self, prompt: str, on_token: Optional[TokenCallback] = None) -> Optional[Tuple[str, str]]:
+        """Returns (provider name, full text), or None if no provider answered."""
+        for provider in self.providers:
+            text = self.cache.get(prompt_key(provider, prompt))
+            if text is not None:
+                await _notify(on_token, provider, text)
+                return provider.name, text
+
+        async with self._slots:
+            for provider in self.providers:
+                chunks: List[str] = []
+                try:
+                    async for token in _with_deadline(provider, prompt):
+                        chunks.append(token)
+                        await _notify(on_token, provider, token)
+                except Exception as e:
+                    print(f"{provider.name} error: {e!r}")
+                    if chunks:
+                        return None
+                    continue
+                text = "".join(chunks).strip()
+                if text:
+                    self.cache.set(prompt_key(provider, prompt), text)
+                    return provider.name, text
+        return None
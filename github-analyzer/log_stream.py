@@ -0,0 +1,67 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Iterator, Optional
+
+# Log lines waiting for a slow client; beyond this the oldest ones are dropped
+DEPLOY_LOG_BUFFER = int(os.getenv("DEPLOY_LOG_BUFFER", "2000"))
+
+LogWriter = Callable[[str], None]
+
+
+class LogStream:
+    """Merges log lines written by concurrent tasks into one stream for a StreamingResponse.
+
+    Writers never wait. The buffer is bounded, so output a client cannot keep up with
+    (a long `docker build`) drops its oldest lines instead of growing memory, and the
+    client is told how many were skipped.
+    """
+
+    def __init__(self, max_lines: int = DEPLOY_LOG_BUFFER):
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def write(self, line: str) -> None:
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(line)
+        self._ready.set()
+
+    def writer(self, host: Optional[str] = None) -> LogWriter:
+        """Write function; lines of a server are prefixed with [host]."""
+        if host is None:
+            return self.write
+        return lambda line: self.write(f"[{host}] {line}")
+
+    def _drain(self) -> Iterator[str]:
+        while self.lines:
+            if self.dropped:
+                # the oldest buffered line follows the gap
+                yield f"… пропущено строк лога: {self.dropped}"
+                self.dropped = 0
+            yield self.lines.popleft()
+
+    async def follow(self, task: Awaitable[Any]) -> AsyncGenerator[str, None]:
+        """Yields lines as they are written until task finishes, then re-raises its error.
+
+        If the generator is closed early (the client went away), the task is cancelled.
+        """
+        task = asyncio.ensure_future(task)
+        waiter = None
+        try:
+            while True:
+                for line in self._drain():
+                    yield line
+                if task.done():
+                    break
+                self._ready.clear()
+                waiter = asyncio.ensure_future(self._ready.wait())
+                await asyncio.wait({waiter, task}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+            task.result()
+        finally:
+            if waiter is not None:
+                waiter.cancel()
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Union
+
+# Maximum number of git/automata processes running at once; further requests wait for a slot
+MAX_PROCESSES = int(os.getenv("ANALYZER_MAX_PROCESSES", "8"))
+
+_slots = asyncio.Semaphore(MAX_PROCESSES)
+
+# Nobody can answer a prompt here: git must fail at once on a private or missing repository
+# instead of waiting for credentials on the terminal until the timeout
+NON_INTERACTIVE_ENV = {"GIT_TERMINAL_PROMPT": "0", "GIT_ASKPASS": ""}
+
+
+async def run_command(
+    cmd: Sequence[str],
+    *,
+    cwd: Optional[Union[str, Path]] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    check: bool = False,
+) -> subprocess.CompletedProcess:
+    """Async counterpart of subprocess.run(capture_output=True, text=True).
+
+    Does not block the event loop. Raises the same exceptions as subprocess.run
+    (FileNotFoundError, subprocess.TimeoutExpired, subprocess.CalledProcessError),
+    so callers keep their existing error handling. The child is killed on timeout
+    or when the awaiting request is cancelled. NON_INTERACTIVE_ENV is always set.
+    """
+    cmd = [str(part) for part in cmd]
+    env = {**(os.environ if env is None else env), **NON_INTERACTIVE_ENV}
+    async with _slots:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            await _kill(proc)
+            raise
+
+    result = subprocess.CompletedProcess(
+        cmd,
+        proc.returncode,
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+    )
+    if check:
+        result.check_returncode()
+    return result
+
+
+async def _kill(proc: asyncio.subprocess.Process) -> None:
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+async def remove_tree(path: Path) -> None:
+    """shutil.rmtree in a worker thread; large checkouts take a while to delete."""
+    await asyncio.to_thread(shutil.rmtree, path, True)
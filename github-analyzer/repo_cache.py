@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from process_utils import remove_tree, run_command
+
+# Where bare mirrors and temporary checkouts live
+CACHE_ROOT = Path(os.getenv("REPO_CACHE_DIR", Path(tempfile.gettempdir()) / "github-analyzer-repos"))
+# Disk quota for all mirrors together, full and blobless; least recently used mirrors are evicted above it
+CACHE_MAX_BYTES = int(os.getenv("REPO_CACHE_MAX_MB", "2048")) * 1024 * 1024
+# A mirror fetched less than this many seconds ago is reused without another fetch
+FETCH_TTL = float(os.getenv("REPO_CACHE_FETCH_TTL", "30"))
+
+CLONE_TIMEOUT = 120
+FETCH_TIMEOUT = 60
+
+# Only branches and tags: a --mirror clone would also pull GitHub's refs/pull/* and their history
+FETCH_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+
+
+class BranchNotFoundError(LookupError):
+    pass
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+async def remote_head(url: str, branch: Optional[str] = None) -> Optional[str]:
+    """Commit SHA the remote branch (default: HEAD) points to, without cloning; None if unreachable."""
+    ref = f"refs/heads/{branch}" if branch else "HEAD"
+    try:
+        result = await run_command(["git", "ls-remote", url, ref], timeout=15)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    line = result.stdout.split("\n", 1)[0].split()
+    return line[0] if result.returncode == 0 and line else None
+
+
+def _escape_pattern(path: str) -> str:
+    """Literal path as a sparse-checkout (gitignore-style) pattern."""
+    return re.sub(r"([\\*?\[\]!# ])", r"\\\1", path)
+
+
+class RepoMirrorCache:
+    """Bare clone (branches and tags) per repository URL plus throwaway worktree checkouts.
+
+    The first request for a repository clones the mirror. Later requests run an incremental
+    `git fetch`, or nothing if the mirror was fetched within FETCH_TTL seconds and has the
+    requested commit (fetch=True always fetches). A per-repo lock makes concurrent requests
+    for the same repository share one clone/fetch. Locks are per process, so run the service
+    with a single worker per cache directory.
+
+    With partial=True mirrors are partial clones (`--filter=blob:none`): commits and trees
+    only, blobs are fetched on demand. Use sparse_checkout() with such a cache.
+
+    Caches created with shared_with=other count each other's mirrors against one max_bytes
+    budget and evict the least recently used mirror of either. The mirror used last is never
+    evicted, so a repository larger than the budget is still reused by the next request.
+    """
+
+    def __init__(self, root: Path = CACHE_ROOT, max_bytes: int = CACHE_MAX_BYTES, fetch_ttl: float = FETCH_TTL,
+                 partial: bool = False, shared_with: Optional["RepoMirrorCache"] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.fetch_ttl = fetch_ttl
+        self.partial = partial
+        self._peers: List["RepoMirrorCache"] = []
+        if shared_with is not None:
+            self._peers.append(shared_with)
+            shared_with._peers.append(self)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._in_use: Dict[str, int] = {}
+        self._checkouts: Dict[Path, str] = {}
+        self._index_path = self.root / "index.json"
+        self._index: Optional[Dict[str, Dict]] = None
+
+    @staticmethod
+    def key(url: str) -> str:
+        """Stable cache key: the same repository with or without .git / trailing slash / case."""
+        normalized = url.strip().rstrip("/")
+        if normalized.endswith(".git"):
+            normalized = normalized[:-4]
+        normalized = normalized.lower()
+        name = re.sub(r"[^a-z0-9]+", "-", normalized.rsplit("/", 1)[-1])
+        return f"{name.strip('-') or 'repo'}-{hashlib.sha1(normalized.encode()).hexdigest()[:12]}"
+
+    def _lock(self, key: str) -> asyncio.Lock:
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if self._index is None:
+            try:
+                self._index = json.loads(self._index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._load_index(), indent=2), encoding="utf-8")
+        os.replace(tmp, self._index_path)
+
+    async def _has_commit(self, mirror: Path, sha: str) -> bool:
+        result = await run_command(["git", "-C", str(mirror), "cat-file", "-e", f"{sha}^{{commit}}"])
+        return result.returncode == 0
+
+    async def _ensure_mirror(self, url: str, key: str, *, fetch: bool = False, want: Optional[str] = None) -> Path:
+        mirror = self.root / f"{key}.git"
+        index = self._load_index()
+        entry = index.get(key)
+        if entry is None or not mirror.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            await remove_tree(mirror)
+            try:
+                await run_command(["git", "clone", "--bare", "--quiet",
+                                   *(["--filter=blob:none"] if self.partial else []), url, str(mirror)],
+                                  check=True, timeout=CLONE_TIMEOUT)
+            except BaseException:
+                await remove_tree(mirror)
+                raise
+        elif (fetch or time.time() - entry.get("fetched_at", 0) >= self.fetch_ttl
+              or (want is not None and not await self._has_commit(mirror, want))):
+            # a bare clone has no fetch refspec configured, so name the refs (also narrows old --mirror clones)
+            await run_command(["git", "-C", str(mirror), "fetch", "--prune", "--quiet", "origin", *FETCH_REFSPECS],
+                              check=True, timeout=FETCH_TIMEOUT)
+            # worktrees of crashed requests
+            await run_command(["git", "-C", str(mirror), "worktree", "prune"])
+        else:
+            return mirror
+        index[key] = {
+            "url": url,
+            "fetched_at": time.time(),
+            "last_used": time.time(),
+            "size": await asyncio.to_thread(_dir_size, mirror),
+        }
+        return mirror
+
+    async def _resolve(self, mirror: Path, branch: Optional[str]) -> Optional[str]:
+        if branch is not None and (not branch or branch.startswith("-")):
+            return None
+        result = await run_command(
+            ["git", "-C", str(mirror), "rev-parse", "--verify", "--quiet", f"{branch or 'HEAD'}^{{commit}}"])
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    async def _add_worktree(self, url: str, branch: Optional[str], fallback: bool,
+                            populate: Callable[[Path, Path, str], Awaitable[None]],
+                            commit: Optional[str] = None, fetch: bool = False) -> Path:
+        key = self.key(url)
+        async with self._lock(key):
+            mirror = await self._ensure_mirror(url, key, fetch=fetch, want=commit)
+            if commit is not None:
+                sha = await self._resolve(mirror, commit)
+                if sha is None:
+                    raise BranchNotFoundError(f"Commit {commit} not found in {url}")
+            else:
+                sha = await self._resolve(mirror, branch)
+                if sha is None and branch is not None and fallback:
+                    sha = await self._resolve(mirror, None)
+                if sha is None:
+                    raise BranchNotFoundError(f"Branch '{branch or 'HEAD'}' not found in {url}")
+
+            worktrees = self.root / "worktrees"
+            worktrees.mkdir(parents=True, exist_ok=True)
+            path = Path(tempfile.mkdtemp(prefix=f"{key}-", dir=worktrees))
+            try:
+                await populate(mirror, path, sha)
+            except BaseException:
+                await remove_tree(path)
+                raise
+            # detector and archives should see a plain tree, not a gitdir pointer into the cache
+            (path / ".git").unlink(missing_ok=True)
+
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            self._checkouts[path] = key
+            self._load_index()[key]["last_used"] = time.time()
+            self._save_index()
+        await self._evict(key)
+        return path
+
+    async def checkout(self, url: str, branch: Optional[str] = None, *, fallback: bool = False,
+                       commit: Optional[str] = None, fetch: bool = False) -> Path:
+        """Fresh working tree of `branch` (default: the remote's default branch).
+
+        With fallback=True a missing branch falls back to the default branch, otherwise
+        BranchNotFoundError is raised. `commit` (e.g. from remote_head()) checks out exactly
+        that commit instead, fetching first if the mirror does not have it yet; fetch=True
+        fetches even within FETCH_TTL, so the branch is checked out as the remote has it now.
+        The tree has no .git, like an exported snapshot; hand it back with release() when
+        done. Git failures propagate as the subprocess exceptions raised by run_command.
+        """
+        async def populate(mirror: Path, path: Path, sha: str) -> None:
+            await run_command(["git", "-C", str(mirror), "worktree", "add", "--detach", "--force", str(path), sha],
+                              check=True, timeout=CLONE_TIMEOUT)
+
+        return await self._add_worktree(url, branch, fallback, populate, commit, fetch)
+
+    async def sparse_checkout(self, url: str, wanted: Callable[[str], bool], branch: Optional[str] = None, *,
+                              fallback: bool = False, commit: Optional[str] = None,
+                              fetch: bool = False) -> Tuple[Path, List[str]]:
+        """Like checkout(), but only files for which wanted(path) is true are written to disk.
+
+        Returns (tree, paths of all files in the commit). The full file list comes from
+        `git ls-tree`, so on a partial mirror only the blobs of the wanted files are downloaded.
+        """
+        files: List[str] = []
+
+        async def populate(mirror: Path, path: Path, sha: str) -> None:
+            listing = await run_command(["git", "-C", str(mirror), "ls-tree", "-r", "-z", "--name-only", sha],
+                                        check=True, timeout=FETCH_TIMEOUT)
+            files.extend(name for name in listing.stdout.split("\0") if name)
+            await run_command(["git", "-C", str(mirror), "worktree", "add", "--detach", "--force", "--no-checkout",
+                               str(path), sha], check=True, timeout=CLONE_TIMEOUT)
+            patterns = "".join(f"/{_escape_pattern(name)}\n" for name in files if wanted(name))
+            await run_command(["git", "-C", str(path), "sparse-checkout", "init", "--no-cone"],
+                              check=True, timeout=FETCH_TIMEOUT)
+            sparse_file = Path((await run_command(["git", "-C", str(path), "rev-parse", "--git-path", "info/sparse-checkout"],
+                                                  check=True)).stdout.strip())
+            if not sparse_file.is_absolute():
+                sparse_file = path / sparse_file
+            sparse_file.write_text(patterns or "!/*\n", encoding="utf-8")
+            # one checkout fetches all missing blobs in a single batch
+            await run_command(["git", "-C", str(path), "checkout", "--quiet", "--detach", sha],
+                              check=True, timeout=CLONE_TIMEOUT)
+
+        path = await self._add_worktree(url, branch, fallback, populate, commit, fetch)
+        return path, files
+
+    async def release(self, path: Path) -> None:
+        """Deletes a checkout made by checkout(); unknown paths are simply removed."""
+        await remove_tree(path)
+        key = self._checkouts.pop(Path(path), None)
+        if key is None:
+            return
+        async with self._lock(key):
+            self._in_use[key] -= 1
+            if key in self._load_index():
+                self._load_index()[key]["last_used"] = time.time()
+            mirror = self.root / f"{key}.git"
+            if mirror.exists():
+                await run_command(["git", "-C", str(mirror), "worktree", "prune"])
+        await self._evict(key)
+
+    def _size(self) -> int:
+        return sum(entry.get("size", 0) for entry in self._load_index().values())
+
+    async def _evict(self, keep: str) -> None:
+        """Evicts least recently used mirrors of this cache and its peers down to max_bytes, except `keep`."""
+        caches = [self] + self._peers
+        total = sum(cache._size() for cache in caches)
+        candidates = sorted((entry.get("last_used", 0), i, key)
+                            for i, cache in enumerate(caches) for key, entry in cache._load_index().items())
+        for _, i, key in candidates:
+            if total <= self.max_bytes:
+                break
+            cache = caches[i]
+            lock = cache._lock(key)
+            if (cache is self and key == keep) or cache._in_use.get(key) or lock.locked():
+                continue
+            async with lock:
+                entry = cache._load_index().pop(key, None)
+                if entry is None:
+                    continue
+                total -= entry.get("size", 0)
+                await remove_tree(cache.root / f"{key}.git")
+        for cache in caches:
+            cache._save_index()
+
+
+mirror_cache = RepoMirrorCache()
+# Blobless mirrors for /analyze: file lists and manifests without downloading the whole tree.
+# Same REPO_CACHE_MAX_MB budget as the full mirrors, not a second one
+partial_mirror_cache = RepoMirrorCache(CACHE_ROOT / "partial", partial=True, shared_with=mirror_cache)
@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from repo_cache import RepoMirrorCache, remote_head
+
+# /analyze result cache settings; ANALYSIS_CACHE_DIR unset means memory only
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+# Results marked "degraded" (the LLM failed, heuristic answer) are kept only this long
+ANALYSIS_CACHE_DEGRADED_TTL = float(os.getenv("ANALYSIS_CACHE_DEGRADED_TTL", "60"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_MB", "64")) * 1024 * 1024
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR") or None
+ANALYSIS_CACHE_DISK_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024
+
+
+def cache_key(*parts: Any) -> str:
+    """Hex digest of the key parts; safe as a file name."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class TTLCache:
+    """LRU cache of JSON-serializable values with a TTL and a byte bound.
+
+    Values live in memory up to max_bytes (measured as their JSON size). If a directory
+    is given, they are also written there as one JSON file each. The directory is bounded
+    by disk_max_bytes, and files are evicted by last access time. It survives restarts.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int, directory: Optional[Path] = None,
+                 disk_max_bytes: int = 0):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                return entry[2]
+            self._drop(key)
+        return self._read_disk(key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        data = json.dumps(value, default=str)
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember(key, expires, len(data), value)
+        self._write_disk(key, expires, data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters since start and the current in-memory footprint."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _remember(self, key: str, expires: float, size: int, value: Any) -> None:
+        if key in self._entries:
+            self._drop(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            raw = path.read_text(encoding="utf-8")
+            entry = json.loads(raw)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires", 0) <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._remember(key, entry["expires"], len(raw), entry["value"])
+        return entry["value"]
+
+    def _write_disk(self, key: str, expires: float, data: str) -> None:
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self._path(key).with_suffix(".tmp")
+            tmp.write_text(f'{{"expires": {expires}, "value": {data}}}', encoding="utf-8")
+            os.replace(tmp, self._path(key))
+            self._trim_disk()
+        except OSError as e:
+            print(f"Cache write error: {e}")
+
+    def _trim_disk(self) -> None:
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The shared call runs as its own task, so a caller that disconnects does not cancel
+    it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        return await asyncio.shield(task)
+
+
+class TokenFeed:
+    """Fans out events of a running analysis to every stream that waits for it.
+
+    Streams subscribe by key, so requests coalesced into one analysis all see its tokens.
+    Events published since the analysis started are replayed to late subscribers;
+    finish() drops them once the analysis is over.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[Hashable, List[asyncio.Queue]] = {}
+        self._sent: Dict[Hashable, List[Any]] = {}
+
+    def publish(self, key: Hashable, event: Any) -> None:
+        self._sent.setdefault(key, []).append(event)
+        for queue in self._subscribers.get(key, []):
+            queue.put_nowait(event)
+
+    def finish(self, key: Hashable) -> None:
+        self._sent.pop(key, None)
+
+    def subscribe(self, key: Hashable) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self._sent.get(key, []):
+            queue.put_nowait(event)
+        self._subscribers.setdefault(key, []).append(queue)
+        return queue
+
+    def unsubscribe(self, key: Hashable, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(key, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._subscribers.pop(key, None)
+
+
+class CachedAnalysis:
+    """Analysis results keyed by (repository, commit SHA, analyzer version).
+
+    The SHA comes from `git ls-remote`, so a hit skips the GitHub API call, the clone,
+    detection and the LLM. On a miss, analyze(sha) must analyze exactly that commit, so the
+    stored result matches its key. Concurrent requests for the same key share one analysis.
+    Only successful results are cached, and "degraded" ones (produced without the LLM)
+    only for ANALYSIS_CACHE_DEGRADED_TTL, so a provider outage is not pinned for the full
+    TTL. If the SHA cannot be resolved (private or unreachable repository), requests are
+    still coalesced but nothing is stored.
+    """
+
+    def __init__(self, version: str, cache: Optional[TTLCache] = None):
+        self.version = version
+        self.cache = cache or TTLCache(ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_MAX_BYTES,
+                                       ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_DISK_MAX_BYTES)
+        self.flights = SingleFlight()
+
+    async def lookup(self, github_url: str) -> Tuple[Optional[str], Optional[str], Optional[Dict[str, Any]]]:
+        """(cache key, commit SHA, cached result); key and SHA are None if the commit is unknown."""
+        sha = await remote_head(github_url)
+        if sha is None:
+            return None, None, None
+        key = cache_key(RepoMirrorCache.key(github_url), sha, self.version)
+        cached = self.cache.get(key)
+        return key, sha, ({**cached, "cached": True} if cached is not None else None)
+
+    def store(self, key: Optional[str], sha: Optional[str], result: Dict[str, Any]) -> None:
+        if key is not None and result.get("status") == "success":
+            ttl = ANALYSIS_CACHE_DEGRADED_TTL if result.get("degraded") else None
+            self.cache.set(key, {**result, "commit": sha}, ttl)
+
+    async def run(self, github_url: str,
+                  analyze: Callable[[Optional[str]], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        key, sha, cached = await self.lookup(github_url)
+        if cached is not None:
+            return cached
+
+        async def analyze_and_store() -> Dict[str, Any]:
+            result = await analyze(sha)
+            self.store(key, sha, result)
+            return result
+
+        return await self.flights.do(key or RepoMirrorCache.key(github_url), analyze_and_store)
@@ -1,20 +1,36 @@
-import os
+import re
+import sys
 import json
-import tempfile
-import shutil
+import asyncio
+import subprocess
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-import paramiko
+
+# automata_cli lives in the parent project; its detector is shared with app.py and the CLI
+AUTOMATA_PATH = Path(__file__).parent.parent
+if str(AUTOMATA_PATH) not in sys.path:
+    sys.path.insert(0, str(AUTOMATA_PATH))
+
+from automata_cli import detect as automata_detect
+from github_client import github_client
+from repo_cache import BranchNotFoundError, mirror_cache
+from delta_sync import SyncStats, sync_tree
+from ssh_pool import SSHSession, ssh_pool
+from log_stream import LogStream, LogWriter
+from result_cache import CachedAnalysis
 
 load_dotenv()
 
-app = FastAPI(title="GitHub Analyzer", version="1.0.0")
+# Part of the /analyze cache key: bump when detection or analysis output changes
+ANALYZER_VERSION = "1.1.0"
+
+app = FastAPI(title="GitHub Analyzer", version=ANALYZER_VERSION)
 
 # CORS middleware
 app.add_middleware(
@@ -28,12 +44,27 @@ app.add_middleware(
 # Mount static files
 app.mount("/static", StaticFiles(directory="front"), name="static")
 
+def detect_summary(path: Path) -> Dict[str, Any]:
+    """Shared detector engine; languages come from manifests and from source file extensions"""
+    result = automata_detect(path)
+    return {
+        "languages": result.all_languages,
+        "file_count": result.file_count,
+        "extensions": result.extensions,
+        "language_bytes": result.language_bytes,
+    }
+
 class SimpleGitHubAnalyzer:
     def __init__(self):
-        pass
+        # simple analysis differs from the LLM one in app.py, so keep their cache entries apart
+        self.results = CachedAnalysis(f"simple-{ANALYZER_VERSION}")
     
     async def analyze_repository(self, github_url: str) -> Dict[str, Any]:
-        """Analyze GitHub repository using simple detection"""
+        """Analyze GitHub repository; repeated and concurrent requests for the same commit share one result"""
+        return await self.results.run(github_url, lambda sha: self._analyze(github_url, sha))
+    
+    async def _analyze(self, github_url: str, commit: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze GitHub repository using simple detection (at `commit` if given)"""
         try:
             # Check if repository is public
             is_public, repo_info = await self._check_repository_visibility(github_url)
@@ -45,10 +76,10 @@ class SimpleGitHubAnalyzer:
                 }
             
             # Clone repository
-            temp_dir = await self._clone_repository(github_url)
+            temp_dir = await self._clone_repository(github_url, commit)
             
-            # Run simple detection
-            detected_info = self._run_simple_detect(temp_dir)
+            # Run simple detection (walks the whole checkout, so keep it off the event loop)
+            detected_info = await asyncio.to_thread(self._run_simple_detect, temp_dir)
             
             # Get analysis
             analysis = self._get_simple_analysis(
@@ -72,10 +103,9 @@ class SimpleGitHubAnalyzer:
                 "repo_info": {}
             }
         finally:
-            if 'temp_dir' in locals() and temp_dir and temp_dir.exists():
-                try:
-                    shutil.rmtree(temp_dir)
-                except PermissionError:
+            if 'temp_dir' in locals() and temp_dir:
+                await mirror_cache.release(temp_dir)
+                if temp_dir.exists():
                     print(f"Warning: Could not delete temp directory {temp_dir}")
     
     async def _check_repository_visibility(self, github_url: str) -> tuple[bool, Dict[str, Any]]:
@@ -88,138 +118,41 @@ class SimpleGitHubAnalyzer:
             
             owner, repo = parts[0], parts[1].replace(".git", "")
             
-            # Check via GitHub API
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"https://api.github.com/repos/{owner}/{repo}")
-                
-                if response.status_code == 404:
-                    raise HTTPException(status_code=404, detail="Репозиторий не найден")
-                
-                if response.status_code == 403:
-                    # Rate limited or private
-                    return False, {"message": "Репозиторий недоступен (возможно приватный)"}
-                
-                repo_data = response.json()
-                return not repo_data.get("private", True), repo_data
+            # Check via GitHub API (shared pooled client, answered from its ETag cache when unchanged)
+            status, repo_data = await github_client.get_repo(owner, repo)
+            
+            if status == 404:
+                raise HTTPException(status_code=404, detail="Репозиторий не найден")
+            
+            if status == 403:
+                # Rate limited or private
+                return False, {"message": "Репозиторий недоступен (возможно приватный)"}
+            
+            repo_data = repo_data or {}
+            return not repo_data.get("private", True), repo_data
                 
         except httpx.HTTPError:
             return False, {"message": "Ошибка при проверке репозитория"}
     
-    async def _clone_repository(self, github_url: str) -> Path:
-        """Clone repository to temporary directory"""
-        temp_dir = Path(tempfile.mkdtemp())
+    async def _clone_repository(self, github_url: str, commit: Optional[str] = None) -> Path:
+        """Check out the default branch (or `commit`, the SHA the result is cached under) from the shared mirror cache"""
         try:
-            import subprocess
-            # Try cloning without specifying branch (gets default branch)
-            result = subprocess.run(
-                ["git", "clone", "--depth", "1", github_url, str(temp_dir)],
-                capture_output=True,
-                text=True,
-                timeout=60  # 60 second timeout
-            )
-            
-            if result.returncode != 0:
-                # If that fails, try to detect and use the default branch
-                if "not found in upstream origin" in result.stderr:
-                    # Try to get the default branch
-                    default_branch_result = subprocess.run([
-                        'git', 'ls-remote', '--symref', github_url, 'HEAD'
-                    ], capture_output=True, text=True, timeout=30)
-                    
-                    if default_branch_result.returncode == 0:
-                        # Extract default branch from output
-                        import re
-                        match = re.search(r'refs/heads/(\w+)', default_branch_result.stdout)
-                        if match:
-                            default_branch = match.group(1)
-                            # Clean up failed attempt
-                            shutil.rmtree(temp_dir, ignore_errors=True)
-                            temp_dir = Path(tempfile.mkdtemp())
-                            
-                            # Try again with default branch
-                            result = subprocess.run(
-                                ["git", "clone", "--depth", "1", "--branch", default_branch, github_url, str(temp_dir)],
-                                capture_output=True,
-                                text=True,
-                                timeout=60
-                            )
-            
-            if result.returncode != 0:
-                try:
-                    shutil.rmtree(temp_dir)
-                except:
-                    pass
-                if "git" in result.stderr.lower() and "not found" in result.stderr.lower():
-                    raise HTTPException(status_code=400, detail="Git не установлен. Установите Git для клонирования репозиториев.")
-                raise HTTPException(status_code=400, detail=f"Не удалось клонировать репозиторий: {result.stderr}")
-            
-            return temp_dir
-            
+            return await mirror_cache.checkout(github_url, commit=commit)
+        except subprocess.CalledProcessError as e:
+            if "git" in e.stderr.lower() and "not found" in e.stderr.lower():
+                raise HTTPException(status_code=400, detail="Git не установлен. Установите Git для клонирования репозиториев.")
+            raise HTTPException(status_code=400, detail=f"Не удалось клонировать репозиторий: {e.stderr}")
         except subprocess.TimeoutExpired:
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
             raise HTTPException(status_code=400, detail="Таймаут при клонировании репозитория")
         except FileNotFoundError:
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
             raise HTTPException(status_code=400, detail="Git не найден. Установите Git для клонирования репозиториев.")
+        except BranchNotFoundError as e:
+            raise HTTPException(status_code=400, detail=f"Не удалось клонировать репозиторий: {e}")
     
     def _run_simple_detect(self, repo_path: Path) -> Dict[str, Any]:
-        """Run simple detection on the repository"""
+        """Run simple detection on the repository (languages by manifests and source files)"""
         try:
-            languages = []
-            file_count = 0
-            
-            # Scan files for language detection
-            for file_path in repo_path.rglob('*'):
-                if file_path.is_file() and '.git' not in str(file_path):
-                    file_count += 1
-                    file_name = file_path.name.lower()
-                    
-                    # Detect languages by file extensions
-                    if file_name.endswith('.py'):
-                        if 'python' not in languages:
-                            languages.append('python')
-                    elif file_name.endswith('.js') or file_name.endswith('.ts'):
-                        if 'javascript' not in languages:
-                            languages.append('javascript')
-                    elif file_name.endswith('.java'):
-                        if 'java' not in languages:
-                            languages.append('java')
-                    elif file_name.endswith('.go'):
-                        if 'go' not in languages:
-                            languages.append('go')
-                    elif file_name.endswith('.rs'):
-                        if 'rust' not in languages:
-                            languages.append('rust')
-                    elif file_name == 'package.json':
-                        if 'node' not in languages:
-                            languages.append('node')
-                    elif file_name == 'requirements.txt':
-                        if 'python' not in languages:
-                            languages.append('python')
-                    elif file_name == 'pom.xml':
-                        if 'java' not in languages:
-                            languages.append('java')
-                    elif file_name == 'go.mod':
-                        if 'go' not in languages:
-                            languages.append('go')
-                    elif file_name == 'cargo.toml':
-                        if 'rust' not in languages:
-                            languages.append('rust')
-                    elif file_name == 'dockerfile':
-                        if 'docker' not in languages:
-                            languages.append('docker')
-            
-            return {
-                "languages": languages,
-                "file_count": file_count
-            }
-            
+            return detect_summary(repo_path)
         except Exception as e:
             print(f"Detection error: {e}")
             return {
@@ -403,21 +336,9 @@ class SimpleDeployService:
     async def test_server_connection(self, server_config: Dict[str, Any]) -> Dict[str, Any]:
         """Test SSH connection to server"""
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            ssh.connect(
-                hostname=server_config['ip'],
-                port=server_config['port'],
-                username=server_config['user'],
-                password=server_config['password'],
-                timeout=10
-            )
-            
-            stdin, stdout, stderr = ssh.exec_command('echo "SSH connection successful"')
-            result = stdout.read().decode().strip()
-            
-            ssh.close()
+            # Pooled session: a deploy right after the check reuses this connection
+            ssh = await ssh_pool.get(server_config, timeout=10)
+            result = (await ssh.run('echo "SSH connection successful"')).stdout.strip()
             
             return {
                 'success': True,
@@ -434,6 +355,7 @@ class SimpleDeployService:
     
     async def deploy_repository(self, server_config: Dict[str, Any], repo_info: Dict[str, Any]):
         """Deploy repository to server"""
+        temp_dir = None
         try:
             yield "🚀 Начинаем развертывание на сервере..."
             
@@ -443,45 +365,41 @@ class SimpleDeployService:
             
             # 2. Analyze project
             yield "🔍 Анализируем технологический стек..."
-            detected_info = self._analyze_project_simple(temp_dir)
+            detected_info = await asyncio.to_thread(self._analyze_project_simple, temp_dir)
             yield f"✅ Обнаружены технологии: {', '.join(detected_info.get('languages', []))}"
             
             # 3. Generate configuration
             yield "⚙️ Генерируем конфигурацию..."
             await self._generate_simple_config(temp_dir, detected_info, repo_info['name'])
             
-            # 4. Create archive
-            yield "📦 Создаем архив проекта..."
-            archive_path = await self._create_archive(temp_dir, repo_info['name'])
-            
-            # 5. Connect to server
+            # 4. Connect to server
             yield f"🔌 Подключаемся к серверу {server_config['ip']}..."
             ssh = await self._connect_to_server(server_config)
             
-            # 6. Upload to server
-            yield "📤 Передаем файлы на сервер..."
+            # 5. Upload changed files to server
+            yield "📤 Передаем изменения на сервер..."
             remote_path = f"{server_config['deployPath']}/{repo_info['name']}"
-            await self._upload_to_server(ssh, archive_path, remote_path)
+            stats = await self._upload_to_server(ssh, temp_dir, remote_path)
+            yield (f"✅ Передано файлов: {stats.sent} из {stats.files}, удалено: {stats.deleted}, "
+                   f"{stats.bytes_sent / 1024:.1f} КБ")
             
-            # 7. Install dependencies
+            # 6. Install dependencies; remote output is forwarded line by line as it arrives
+            logs = LogStream()
             yield "🔧 Устанавливаем зависимости..."
-            await self._install_dependencies(ssh, remote_path, detected_info)
+            async for line in logs.follow(self._install_dependencies(ssh, remote_path, detected_info, logs.writer())):
+                yield line
             
-            # 8. Deploy application
+            # 7. Deploy application
             yield "🚀 Запускаем приложение..."
             yield "🐳 Создаем/обновляем Dockerfile..."
-            await self._deploy_application(ssh, remote_path, repo_info['name'], detected_info)
+            async for line in logs.follow(self._deploy_application(ssh, remote_path, repo_info['name'], detected_info,
+                                                                   logs.writer())):
+                yield line
             
-            # 9. Check status
+            # 8. Check status
             yield "🔍 Проверяем статус приложения..."
             app_status = await self._check_app_status(ssh, repo_info['name'])
             
-            ssh.close()
-            
-            # Cleanup
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            os.remove(archive_path)
-            
             # Report final status
             if app_status.get('status') == 'running':
                 yield "✅ Развертывание завершено успешно!"
@@ -499,111 +417,35 @@ class SimpleDeployService:
         except Exception as e:
             yield f"❌ Ошибка развертывания: {str(e)}"
             raise
+        finally:
+            # Cleanup: also on failure, otherwise the mirror stays pinned and is never evicted
+            if temp_dir:
+                await mirror_cache.release(temp_dir)
     
     async def _clone_repository(self, repo_info: Dict[str, Any]) -> Path:
-        """Clone repository to temporary directory"""
-        temp_dir = Path(tempfile.mkdtemp())
+        """Check out the requested branch (or the default one) from the shared mirror cache"""
         branch = repo_info.get('branch', 'main')
         repo_url = repo_info['url']
         
-        import subprocess
         try:
-            # First try with the specified branch
-            result = subprocess.run([
-                'git', 'clone', '--depth', '1', '--branch', branch, 
-                repo_url, str(temp_dir)
-            ], capture_output=True, text=True, timeout=120)
-            
-            if result.returncode != 0:
-                # If branch not found, try to detect the default branch
-                if "not found in upstream origin" in result.stderr:
-                    # Try to get the default branch
-                    default_branch_result = subprocess.run([
-                        'git', 'ls-remote', '--symref', repo_url, 'HEAD'
-                    ], capture_output=True, text=True, timeout=30)
-                    
-                    if default_branch_result.returncode == 0:
-                        # Extract default branch from output like "ref: refs/heads/main HEAD"
-                        import re
-                        match = re.search(r'refs/heads/(\w+)', default_branch_result.stdout)
-                        if match:
-                            default_branch = match.group(1)
-                            # Clean up failed attempt
-                            import shutil
-                            shutil.rmtree(temp_dir, ignore_errors=True)
-                            temp_dir = Path(tempfile.mkdtemp())
-                            
-                            # Try again with default branch
-                            result = subprocess.run([
-                                'git', 'clone', '--depth', '1', '--branch', default_branch, 
-                                repo_url, str(temp_dir)
-                            ], capture_output=True, text=True, timeout=120)
-                            
-                            if result.returncode == 0:
-                                return temp_dir
-                    
-                    # If we still can't find a branch, try without specifying branch (gets default)
-                    import shutil
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-                    temp_dir = Path(tempfile.mkdtemp())
-                    
-                    result = subprocess.run([
-                        'git', 'clone', '--depth', '1', repo_url, str(temp_dir)
-                    ], capture_output=True, text=True, timeout=120)
-                
-                if result.returncode != 0:
-                    error_msg = f"Failed to clone repository {repo_url}"
-                    if result.stderr:
-                        error_msg += f"\nGit error: {result.stderr}"
-                    if result.stdout:
-                        error_msg += f"\nGit output: {result.stdout}"
-                    raise Exception(error_msg)
-            
-            return temp_dir
-            
+            # The mirror has every branch, so a missing branch falls back to the default without re-cloning;
+            # always fetch, so a deploy right after a push ships the new commit
+            return await mirror_cache.checkout(repo_url, branch, fallback=True, fetch=True)
         except subprocess.TimeoutExpired:
-            # Cleanup temp directory
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
             raise Exception(f"Timeout while cloning repository {repo_url}")
         except FileNotFoundError:
-            # Cleanup temp directory
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
             raise Exception("Git is not installed. Please install Git to clone repositories.")
+        except subprocess.CalledProcessError as e:
+            error_msg = f"Failed to clone repository {repo_url}"
+            if e.stderr:
+                error_msg += f"\nGit error: {e.stderr}"
+            raise Exception(error_msg)
         except Exception as e:
-            # Cleanup temp directory
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
             raise Exception(f"Error cloning repository {repo_url}: {str(e)}")
     
     def _analyze_project_simple(self, project_path: Path) -> Dict[str, Any]:
         """Simple project analysis"""
-        languages = []
-        file_count = 0
-        
-        for file_path in project_path.rglob('*'):
-            if file_path.is_file() and '.git' not in str(file_path):
-                file_count += 1
-                file_name = file_path.name.lower()
-                
-                if file_name.endswith('.py') or file_name == 'requirements.txt':
-                    if 'python' not in languages:
-                        languages.append('python')
-                elif file_name.endswith('.js') or file_name == 'package.json':
-                    if 'node' not in languages:
-                        languages.append('node')
-                elif file_name.endswith('.java') or file_name in ['pom.xml', 'build.gradle']:
-                    if 'java' not in languages:
-                        languages.append('java')
-                elif file_name.endswith('.go') or file_name == 'go.mod':
-                    if 'go' not in languages:
-                        languages.append('go')
-                elif file_name == 'dockerfile':
-                    if 'docker' not in languages:
-                        languages.append('docker')
-        
-        return {"languages": languages, "file_count": file_count}
+        return detect_summary(project_path)
     
     async def _generate_simple_config(self, project_path: Path, detected_info: Dict[str, Any], project_name: str):
         """Generate simple automata.yml config"""
@@ -644,193 +486,120 @@ class SimpleDeployService:
         with open(config_path, 'w', encoding='utf-8') as f:
             yaml.dump(config, f, default_flow_style=False, allow_unicode=True)
     
-    async def _create_archive(self, project_path: Path, project_name: str) -> str:
-        """Create project archive"""
-        archive_path = tempfile.mktemp(suffix='.tar.gz')
-        
-        import subprocess
-        subprocess.run([
-            'tar', '-czf', archive_path, '-C', str(project_path.parent), project_path.name
-        ], check=True, capture_output=True)
-        
-        return archive_path
+    async def _connect_to_server(self, server_config: Dict[str, Any]) -> SSHSession:
+        """Get a pooled SSH session to the server (connects only if there is none yet)"""
+        return await ssh_pool.get(server_config)
     
-    async def _connect_to_server(self, server_config: Dict[str, Any]) -> paramiko.SSHClient:
-        """Connect to server via SSH"""
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        ssh.connect(
-            hostname=server_config['ip'],
-            port=server_config['port'],
-            username=server_config['user'],
-            password=server_config['password'],
-            timeout=30
-        )
-        
-        return ssh
+    async def _upload_to_server(self, ssh: SSHSession, project_path: Path, remote_path: str) -> SyncStats:
+        """Sync project to server against the remote manifest: only changed files are sent, removed ones deleted"""
+        return await sync_tree(ssh, project_path, remote_path)
     
-    async def _upload_to_server(self, ssh: paramiko.SSHClient, archive_path: str, remote_path: str):
-        """Upload and extract archive on server"""
-        sftp = ssh.open_sftp()
-        
-        # Create directory
-        stdin, stdout, stderr = ssh.exec_command(f'mkdir -p {remote_path}')
-        stdout.channel.recv_exit_status()
-        
-        # Upload archive
-        remote_archive = f"{remote_path}/project.tar.gz"
-        sftp.put(archive_path, remote_archive)
-        
-        # Extract archive
-        stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && tar -xzf project.tar.gz --strip-components=1')
-        stdout.channel.recv_exit_status()
-        
-        # Remove archive
-        stdin, stdout, stderr = ssh.exec_command(f'rm {remote_archive}')
-        stdout.channel.recv_exit_status()
-        
-        sftp.close()
-    
-    async def _install_dependencies(self, ssh: paramiko.SSHClient, remote_path: str, detected_info: Dict[str, Any]):
+    async def _install_dependencies(self, ssh: SSHSession, remote_path: str, detected_info: Dict[str, Any],
+                                    log: Optional[LogWriter] = None):
         """Install dependencies on server"""
         languages = detected_info.get('languages', [])
         
-        # Install Docker
-        stdin, stdout, stderr = ssh.exec_command('which docker || (curl -fsSL https://get.docker.com -o get-docker.sh && sh get-docker.sh)')
-        stdout.channel.recv_exit_status()
+        # System packages go in one sequential script: apt-get cannot run concurrently
+        system = ['which docker || (curl -fsSL https://get.docker.com -o get-docker.sh && sh get-docker.sh)']
+        project = []
         
         if 'python' in languages:
-            stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && python3 -m pip install --upgrade pip')
-            stdout.channel.recv_exit_status()
-            
             # Only install requirements.txt if it exists
-            stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && ls requirements.txt')
-            if stdout.channel.recv_exit_status() == 0:
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && pip3 install -r requirements.txt')
-                stdout.channel.recv_exit_status()
+            project.append(f'cd {remote_path} && {{ python3 -m pip install --upgrade pip; '
+                           f'if [ -f requirements.txt ]; then pip3 install -r requirements.txt; fi; }}')
         
         if 'node' in languages:
-            stdin, stdout, stderr = ssh.exec_command('which node || (curl -fsSL https://deb.nodesource.com/setup_18.x | sudo -E bash - && sudo apt-get install -y nodejs)')
-            stdout.channel.recv_exit_status()
-            
-            stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && npm install')
-            stdout.channel.recv_exit_status()
+            system.append('which node || (curl -fsSL https://deb.nodesource.com/setup_18.x | sudo -E bash - && sudo apt-get install -y nodejs)')
+            project.append(f'cd {remote_path} && npm install')
         
         if 'java' in languages:
-            # Install Java and build tools
-            stdin, stdout, stderr = ssh.exec_command('apt-get update && apt-get install -y openjdk-17-jdk')
-            stdout.channel.recv_exit_status()
-            
-            # Check if it's a Gradle project
-            stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && ls build.gradle*')
-            if stdout.channel.recv_exit_status() == 0:
-                # Install Gradle wrapper permissions
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && chmod +x gradlew')
-                stdout.channel.recv_exit_status()
-            else:
-                # Install Maven for Maven projects
-                stdin, stdout, stderr = ssh.exec_command('apt-get install -y maven')
-                stdout.channel.recv_exit_status()
+            # Install Java and build tools; Maven only for non-Gradle projects
+            system.append('apt-get update && apt-get install -y openjdk-17-jdk')
+            system.append(f'if ls {remote_path}/build.gradle* >/dev/null 2>&1; then chmod +x {remote_path}/gradlew; '
+                          f'else apt-get install -y maven; fi')
+        
+        await ssh.run('; '.join(system), on_line=log)
+        # Per-language project dependencies are independent: one channel each, in parallel
+        await ssh.run_many(project, on_line=log)
     
-    async def _deploy_application(self, ssh: paramiko.SSHClient, remote_path: str, project_name: str, detected_info: Dict[str, Any]):
+    async def _deploy_application(self, ssh: SSHSession, remote_path: str, project_name: str, detected_info: Dict[str, Any],
+                                  log: Optional[LogWriter] = None):
         """Deploy application using Docker"""
         languages = detected_info.get('languages', [])
         
         # For Java projects, we need to build the project first
         if 'java' in languages:
-            # Check if it's a Gradle project
-            stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && ls build.gradle*')
-            if stdout.channel.recv_exit_status() == 0:
-                # Build Gradle project
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && ./gradlew build -x test')
-                exit_status = stdout.channel.recv_exit_status()
-                if exit_status != 0:
-                    error_output = stderr.read().decode().strip()
-                    raise Exception(f"Failed to build Gradle project: {error_output}")
-            else:
-                # Check if it's a Maven project
-                stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && ls pom.xml')
-                if stdout.channel.recv_exit_status() == 0:
-                    # Build Maven project
-                    stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && mvn clean package -DskipTests')
-                    exit_status = stdout.channel.recv_exit_status()
-                    if exit_status != 0:
-                        error_output = stderr.read().decode().strip()
-                        raise Exception(f"Failed to build Maven project: {error_output}")
-        
-        # Always regenerate Dockerfile to ensure it's up to date
+            # Gradle if there is a build.gradle, otherwise Maven if there is a pom.xml
+            tool = (await ssh.run(
+                f'cd {remote_path} && if ls build.gradle* >/dev/null 2>&1; then echo Gradle; '
+                f'elif [ -f pom.xml ]; then echo Maven; fi')).stdout.strip()
+            build = {'Gradle': './gradlew build -x test', 'Maven': 'mvn clean package -DskipTests'}.get(tool)
+            if build:
+                result = await ssh.run(f'cd {remote_path} && {build}', on_line=log)
+                if not result.ok:
+                    raise Exception(f"Failed to build {tool} project: {result.stderr.strip()}")
+        
+        # Always regenerate Dockerfile to ensure it's up to date; the old container is
+        # removed at the same time on a second channel
         dockerfile_content = self._generate_dockerfile(languages)
-        stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && cat > Dockerfile << "EOF"\n{dockerfile_content}\nEOF')
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status != 0:
-            error_output = stderr.read().decode().strip()
-            raise Exception(f"Failed to create Dockerfile: {error_output}")
+        dockerfile, _ = await ssh.run_many([
+            f'cd {remote_path} && cat > Dockerfile << "EOF"\n{dockerfile_content}\nEOF\ncat Dockerfile',
+            f'docker stop {project_name}-app 2>/dev/null || true; docker rm {project_name}-app 2>/dev/null || true',
+        ])
+        if not dockerfile.ok:
+            raise Exception(f"Failed to create Dockerfile: {dockerfile.stderr.strip()}")
         
         # Verify Dockerfile was created correctly
-        stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && cat Dockerfile')
-        dockerfile_check = stdout.read().decode().strip()
+        dockerfile_check = dockerfile.stdout.strip()
         if "requirements.txt*" not in dockerfile_check:
             raise Exception(f"Dockerfile was not updated correctly. Content: {dockerfile_check}")
         
-        # Stop and remove existing container
-        stdin, stdout, stderr = ssh.exec_command(f'docker stop {project_name}-app 2>/dev/null || true')
-        stdout.channel.recv_exit_status()
-        
-        stdin, stdout, stderr = ssh.exec_command(f'docker rm {project_name}-app 2>/dev/null || true')
-        stdout.channel.recv_exit_status()
-        
         # Build Docker image
-        stdin, stdout, stderr = ssh.exec_command(f'cd {remote_path} && docker build -t {project_name}:latest .')
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status != 0:
-            error_output = stderr.read().decode().strip()
-            raise Exception(f"Failed to build Docker image: {error_output}")
+        result = await ssh.run(f'cd {remote_path} && docker build -t {project_name}:latest .', on_line=log)
+        if not result.ok:
+            raise Exception(f"Failed to build Docker image: {result.stderr.strip()}")
         
         # Run new container
         port = 8080 if 'java' in languages else 8000
-        stdin, stdout, stderr = ssh.exec_command(f'docker run -d --name {project_name}-app -p {port}:{port} {project_name}:latest')
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status != 0:
-            error_output = stderr.read().decode().strip()
-            raise Exception(f"Failed to start container: {error_output}")
+        result = await ssh.run(f'docker run -d --name {project_name}-app -p {port}:{port} {project_name}:latest', on_line=log)
+        if not result.ok:
+            raise Exception(f"Failed to start container: {result.stderr.strip()}")
         
         # Wait a moment for container to start
-        import asyncio
         await asyncio.sleep(2)
         
-        # Check if container is running
-        stdin, stdout, stderr = ssh.exec_command(f'docker ps --filter "name={project_name}-app" --format "{{{{.Names}}}}"')
-        container_name = stdout.read().decode().strip()
-        if not container_name:
-            # Check if container exists but stopped
-            stdin, stdout, stderr = ssh.exec_command(f'docker ps -a --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}"')
-            container_status = stdout.read().decode().strip()
-            if container_status:
+        # Check if container is running; existing (maybe stopped) container and its logs in the same round trip
+        running, existing, logs = await ssh.run_many([
+            f'docker ps --filter "name={project_name}-app" --format "{{{{.Names}}}}"',
+            f'docker ps -a --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}"',
+            f'docker logs {project_name}-app',
+        ])
+        if not running.stdout.strip():
+            if existing.stdout.strip():
                 # Container exists but is stopped - this might be normal for some apps
-                stdin, stdout, stderr = ssh.exec_command(f'docker logs {project_name}-app')
-                logs = stdout.read().decode().strip()
-                print(f"Container stopped. Logs: {logs}")
+                print(f"Container stopped. Logs: {logs.stdout.strip()}")
                 # Don't raise exception - container might have completed its task successfully
             else:
                 # Container doesn't exist at all
                 raise Exception(f"Container {project_name}-app was not created")
     
-    async def _check_app_status(self, ssh: paramiko.SSHClient, project_name: str) -> Dict[str, Any]:
+    async def _check_app_status(self, ssh: SSHSession, project_name: str) -> Dict[str, Any]:
         """Check application status"""
-        # Check running containers
-        stdin, stdout, stderr = ssh.exec_command(f'docker ps --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}:{{{{.Ports}}}}"')
-        container_info = stdout.read().decode().strip()
+        # Running containers, port mapping and stopped containers in one round trip
+        running, ports, all_containers = await ssh.run_many([
+            f'docker ps --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}:{{{{.Ports}}}}"',
+            f'docker port {project_name}-app',
+            f'docker ps -a --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}"',
+        ])
+        container_info = running.stdout.strip()
         
         if container_info:
             # Get port information
-            stdin, stdout, stderr = ssh.exec_command(f'docker port {project_name}-app')
-            port_info = stdout.read().decode().strip()
+            port_info = ports.stdout.strip()
             
             # Extract port from port_info (format: 0.0.0.0:8080->8080/tcp)
             port = "8080"  # default
             if port_info:
-                import re
                 port_match = re.search(r':(\d+)->', port_info)
                 if port_match:
                     port = port_match.group(1)
@@ -844,8 +613,7 @@ class SimpleDeployService:
             }
         else:
             # Check if container exists but is stopped
-            stdin, stdout, stderr = ssh.exec_command(f'docker ps -a --filter "name={project_name}-app" --format "{{{{.Names}}}}:{{{{.Status}}}}"')
-            all_containers = stdout.read().decode().strip()
+            all_containers = all_containers.stdout.strip()
             
             if all_containers:
                 return {
@@ -1022,6 +790,11 @@ async def stop_deploy():
     """Stop active deployment"""
     return {"status": "stopped"}
 
+@app.on_event("shutdown")
+async def close_github_client():
+    await github_client.aclose()
+    ssh_pool.close_all()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
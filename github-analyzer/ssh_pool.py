@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, BinaryIO, Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import paramiko
+
+# Authenticated connections idle for longer than this are closed
+SSH_POOL_IDLE_TIMEOUT = float(os.getenv("SSH_POOL_IDLE_TIMEOUT", "300"))
+# Keepalive packets stop NATs and firewalls from dropping pooled connections
+SSH_KEEPALIVE = int(os.getenv("SSH_KEEPALIVE", "30"))
+# Lines of each stream kept in RemoteResult when the output is streamed with on_line
+SSH_OUTPUT_TAIL_LINES = int(os.getenv("SSH_OUTPUT_TAIL_LINES", "200"))
+
+# \r too: progress bars (docker build, pip, npm) redraw one line with carriage returns
+_LINE_BREAK = re.compile(rb"\r\n|\r|\n")
+
+LineCallback = Callable[[str], None]
+
+
+class RemoteResult(NamedTuple):
+    exit_status: int
+    stdout: str
+    stderr: str
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_status == 0
+
+
+def _pump(recv: Callable[[int], bytes], on_line: LineCallback, tail: Deque[str]) -> None:
+    """Reads a channel stream to EOF, passing each line on and keeping only the last ones."""
+    pending = b""
+    while True:
+        data = recv(32768)
+        if data:
+            *lines, pending = _LINE_BREAK.split(pending + data)
+        else:
+            lines, pending = [pending], b""
+        for raw in lines:
+            if raw:
+                line = raw.decode(errors="replace")
+                tail.append(line)
+                on_line(line)
+        if not data:
+            return
+
+
+class SSHSession:
+    """One authenticated SSH transport; every command gets its own channel on it.
+
+    Channels are multiplexed, so run_many() runs independent commands at the same time
+    and pays one round trip for all of them instead of one per command. Blocking paramiko
+    calls run in worker threads, so the event loop is never blocked.
+    """
+
+    def __init__(self, client: paramiko.SSHClient, secret: str):
+        self.client = client
+        self.secret = secret
+        self.last_used = time.monotonic()
+        self.busy = 0
+        self.retired = False
+        self._sftp: Optional[paramiko.SFTPClient] = None
+        self._sftp_lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _exec(self, command: str, timeout: Optional[float],
+              produce: Optional[Callable[[BinaryIO], None]] = None,
+              on_line: Optional[LineCallback] = None) -> RemoteResult:
+        stdin, stdout, stderr = self.client.exec_command(command, timeout=timeout)
+        # read both streams while stdin is written, otherwise a chatty command can fill the window and stall
+        out_chunks: List[bytes] = []
+        err_chunks: List[bytes] = []
+        if on_line is None:
+            readers = [
+                threading.Thread(target=lambda: out_chunks.append(stdout.read()), daemon=True),
+                threading.Thread(target=lambda: err_chunks.append(stderr.read()), daemon=True),
+            ]
+        else:
+            out_tail: Deque[str] = deque(maxlen=SSH_OUTPUT_TAIL_LINES)
+            err_tail: Deque[str] = deque(maxlen=SSH_OUTPUT_TAIL_LINES)
+            readers = [
+                threading.Thread(target=_pump, args=(stdout.channel.recv, on_line, out_tail), daemon=True),
+                threading.Thread(target=_pump, args=(stderr.channel.recv_stderr, on_line, err_tail), daemon=True),
+            ]
+        for reader in readers:
+            reader.start()
+        error: Optional[BaseException] = None
+        try:
+            if produce is not None:
+                produce(stdin)
+        except Exception as e:
+            error = e
+        finally:
+            stdin.close()
+            stdin.channel.shutdown_write()
+        for reader in readers:
+            reader.join()
+        status = stdout.channel.recv_exit_status()
+        if on_line is None:
+            result = RemoteResult(status, b"".join(out_chunks).decode(errors="replace"),
+                                  b"".join(err_chunks).decode(errors="replace"))
+        else:
+            result = RemoteResult(status, "\n".join(out_tail), "\n".join(err_tail))
+        # the remote side failing first usually explains the local write error, so prefer its output
+        if error is not None and result.ok:
+            raise error
+        return result
+
+    async def run(self, command: str, *, timeout: Optional[float] = None, check: bool = False,
+                  on_line: Optional[LineCallback] = None) -> RemoteResult:
+        """Runs a command and waits for it; with check=True a non-zero exit raises RuntimeError.
+
+        With on_line, every stdout/stderr line is passed to it on the event loop as soon as
+        it arrives, and the result keeps only the last SSH_OUTPUT_TAIL_LINES of each stream.
+        """
+        if on_line is not None:
+            loop = asyncio.get_running_loop()
+            callback = on_line
+            on_line = lambda line: loop.call_soon_threadsafe(callback, line)
+        self.busy += 1
+        try:
+            result = await asyncio.to_thread(self._exec, command, timeout, None, on_line)
+        finally:
+            self._done()
+        if check and not result.ok:
+            raise RuntimeError(f"'{command}' exited with {result.exit_status}: {result.stderr.strip()}")
+        return result
+
+    async def pipe(self, command: str, produce: Callable[[BinaryIO], None], *,
+                   timeout: Optional[float] = None, check: bool = False) -> RemoteResult:
+        """Runs a command while produce(stdin) streams data into it from a worker thread."""
+        self.busy += 1
+        try:
+            result = await asyncio.to_thread(self._exec, command, timeout, produce)
+        finally:
+            self._done()
+        if check and not result.ok:
+            raise RuntimeError(f"'{command}' exited with {result.exit_status}: {result.stderr.strip()}")
+        return result
+
+    async def run_many(self, commands: Sequence[str], *, timeout: Optional[float] = None,
+                       on_line: Optional[LineCallback] = None) -> List[RemoteResult]:
+        """Runs independent commands concurrently, each on its own channel."""
+        return list(await asyncio.gather(*(self.run(command, timeout=timeout, on_line=on_line)
+                                           for command in commands)))
+
+    def _put(self, files: Sequence[Tuple[str, str]]) -> None:
+        with self._sftp_lock:
+            if self._sftp is None:
+                self._sftp = self.client.open_sftp()
+            for local, remote in files:
+                self._sftp.put(local, remote)
+
+    async def put(self, files: Sequence[Tuple[str, str]]) -> None:
+        """Uploads (local path, remote path) pairs over one SFTP channel kept with the session."""
+        self.busy += 1
+        try:
+            await asyncio.to_thread(self._put, files)
+        finally:
+            self._done()
+
+    def _done(self) -> None:
+        self.busy -= 1
+        self.last_used = time.monotonic()
+        if self.retired and not self.busy:
+            self.close()
+
+    def retire(self) -> None:
+        """Closes the session once the commands still running on it have finished."""
+        self.retired = True
+        if not self.busy:
+            self.close()
+
+    def close(self) -> None:
+        with self._sftp_lock:
+            if self._sftp is not None:
+                self._sftp.close()
+                self._sftp = None
+        self.client.close()
+
+
+class SSHPool:
+    """Authenticated SSH sessions shared by deploys and status checks, keyed by (host, port, user).
+
+    A session is reused only when the same password is supplied again; otherwise the
+    server authenticates the new one. Sessions idle for idle_timeout seconds are closed.
+    """
+
+    def __init__(self, idle_timeout: float = SSH_POOL_IDLE_TIMEOUT, keepalive: int = SSH_KEEPALIVE):
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self._sessions: Dict[Tuple[str, int, str], SSHSession] = {}
+        self._locks: Dict[Tuple[str, int, str], asyncio.Lock] = {}
+
+    @staticmethod
+    def key(server_config: Dict[str, Any]) -> Tuple[str, int, str]:
+        return server_config['ip'], int(server_config['port']), server_config['user']
+
+    @staticmethod
+    def _secret(server_config: Dict[str, Any]) -> str:
+        return hashlib.sha256(str(server_config.get('password', '')).encode()).hexdigest()
+
+    def _connect(self, server_config: Dict[str, Any], timeout: float) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname=server_config['ip'],
+            port=int(server_config['port']),
+            username=server_config['user'],
+            password=server_config['password'],
+            timeout=timeout
+        )
+        client.get_transport().set_keepalive(self.keepalive)
+        return client
+
+    async def get(self, server_config: Dict[str, Any], timeout: float = 30) -> SSHSession:
+        """Pooled session for the server, connecting (once, for concurrent callers) if needed."""
+        self._reap()
+        key = self.key(server_config)
+        secret = self._secret(server_config)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            session = self._sessions.get(key)
+            if session is not None and session.active and session.secret == secret:
+                session.last_used = time.monotonic()
+                return session
+            client = await asyncio.to_thread(self._connect, server_config, timeout)
+            if session is not None:
+                session.retire()
+            session = self._sessions[key] = SSHSession(client, secret)
+            return session
+
+    def _reap(self) -> None:
+        now = time.monotonic()
+        for key, session in list(self._sessions.items()):
+            if not session.active or (not session.busy and now - session.last_used > self.idle_timeout):
+                del self._sessions[key]
+                session.retire()
+
+    def close_all(self) -> None:
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+ssh_pool = SSHPool()